@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -6,43 +6,62 @@ import random
 from security import verify_token
 from security import create_access_token
 from api_admin.conversation import router as conversation_router
-from database.crud import chat as chat_crud, session as session_crud, survey as survey_crud, topic as topic_crud
-from database.config import get_db
+from database.crud import chat as chat_crud, session as session_crud, survey as survey_crud, topic as topic_crud, daily_chat_stats
+from database.config import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from api_admin.questionbank import router as questionbank_router
 from api_admin.org import router as org_router
+from api_admin.search import router as search_router
+from api_admin.llm import router as llm_router
+from response_cache import response_cache
+from config import settings
+from api_admin.db import router as db_router
 router = APIRouter(prefix="/api/admin")
 
 # 包含conversation路由
 router.include_router(conversation_router, prefix="/conversation", tags=["conversation"])
 router.include_router(questionbank_router,prefix="/questionbank", tags=["questionbank"])
 router.include_router(org_router, prefix="/org", tags=["org"])
+router.include_router(search_router, prefix="/search", tags=["search"])
+router.include_router(llm_router, prefix="/llm", tags=["llm"])
+router.include_router(db_router, prefix="/db", tags=["db"])
 
 # API路由
 @router.get("/dashboard")
-async def get_dashboard_data(current_user = Depends(verify_token)):
-    db = next(get_db())
-    # 计算今日对话数
+async def get_dashboard_data(request: Request, current_user = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    # 各标签页轮询的结果相同，短时间内直接返回缓存，内容未变时返回304
+    return await response_cache.respond(request, "dashboard", settings.DASHBOARD_CACHE_TTL, lambda: compute_dashboard_data(db))
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user = Depends(verify_token)):
+    """获取管理后台响应缓存统计"""
+    return response_cache.get_stats()
+
+async def compute_dashboard_data(db: AsyncSession):
+    # 从预聚合的对话日统计读取：各机构合计一次，近7天按天合计一次
     today = datetime.now().date()
-    chat_count = chat_crud.countAll(db)
-    chat_today_count = chat_crud.countToday(db)
-    topic_count = topic_crud.countAll(db)
+    org_totals = await daily_chat_stats.getOrgTotals(db)
+    daily_counts = await daily_chat_stats.getDailyCounts(db, today - timedelta(days=6))
+    topic_count = await topic_crud.countAll(db)
 
-    survey_count = survey_crud.getAllN0SurveyCount(db)
+    chat_count = sum(item["count"] for item in org_totals)
+    chat_today_count = daily_counts.get(today, 0)
+    survey_count = sum(item["unsolved"] for item in org_totals)
     solvedRate = (chat_count - survey_count) / chat_count if chat_count else 0
     
     # 生成近7天的对话趋势
     trend_data = []
     for i in range(6, -1, -1):
         date = today - timedelta(days=i)
-        count = chat_crud.getByDayCount(db, date)
         trend_data.append({
             "date": date.isoformat(),
-            "count": count
+            "count": daily_counts.get(date, 0)
         })
     
 
-    # 生成排名前5的机构
-    chat_top5 = chat_crud.getByOrgCodeTop7(db)
+    # 生成对话数排名前7的机构
+    chat_top5 = [{"orgCode": item["orgCode"], "count": item["count"]}
+                 for item in sorted(org_totals, key=lambda item: item["count"], reverse=True)[:7]]
     
     
     return {
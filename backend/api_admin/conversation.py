@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import random
-from sqlalchemy.orm import Session
-from database.config import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.config import get_async_db
 from database.models import Topic, Org, Chat, Message, Session
 from security import verify_token
-from database.crud import chat as chat_crud
+from database.crud import chat as chat_crud, daily_chat_stats
+from api_admin.pagination import encode_cursor, decode_cursor, cached_total
+from response_cache import response_cache
+from config import settings
 import json
 router = APIRouter()
 
@@ -26,6 +30,8 @@ class ConversationsListResponse(BaseModel):
     total: int
     page: int
     pageSize: int
+    # 下一页的游标，没有更多数据时为None
+    nextCursor: Optional[str] = None
 
 class MessageResponse(BaseModel):
     id: str
@@ -53,22 +59,36 @@ async def get_conversations(
     branchId: Optional[str] = None,
     searchTerm: Optional[str] = None,
     solvedFilter: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取对话列表"""
+    """获取对话列表
 
-    # 在实际应用中，应该从数据库获取数据
-    chats = chat_crud.getByFilter(
+    传入上一页返回的nextCursor时按(createdAt, id)键集分页，深页与第一页开销相同；
+    不传时按page偏移，用于直接跳页。总数按筛选条件缓存，无筛选时取自对话日统计。
+    """
+    filters = dict(orgCode=branchId, startDate=startDate, endDate=endDate,
+                   searchTerm=searchTerm, solvedFilter=solvedFilter)
+    before = None
+    if cursor:
+        created_at, id = decode_cursor(cursor, 2)
+        try:
+            before = (datetime.fromisoformat(created_at), int(id))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+    chats = await chat_crud.getByFilter(
         db,
         skip=(page-1)*pageSize,
         limit=pageSize,
-        orgCode=branchId,
-        startDate=startDate,
-        endDate=endDate,
-        searchTerm=searchTerm,
-        solvedFilter=solvedFilter
+        before=before,
+        **filters
     )
+    if any(filters.values()):
+        total = await cached_total(("chats",) + tuple(sorted(filters.items())), lambda: chat_crud.countByFilter(db, **filters))
+    else:
+        total = await daily_chat_stats.countChats(db)
+    # 关联的会话、机构和调查已由getByFilter预先加载
     return {
         "data": [
             {
@@ -86,24 +106,30 @@ async def get_conversations(
             }
             for chat in chats
         ],
-        "total": len(chats),
+        "total": total,
         "page": page,
-        "pageSize": pageSize
+        "pageSize": pageSize,
+        "nextCursor": encode_cursor(chats[-1].createdAt, chats[-1].id) if len(chats) == pageSize else None
     }
 
 @router.get("/conversations/{chat_id}", response_model=ConversationDetailResponse)
 async def get_conversation_detail(
     chat_id: str,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取对话详情"""
     # 从数据库获取对话详情
-    chat = chat_crud.getByChatId(db, chat_id)
+    chat = await chat_crud.getByChatId(db, chat_id)
     
     if not chat:
         raise HTTPException(status_code=404, detail="对话不存在")
     
+    return await db.run_sync(lambda _: conversation_detail(chat))
+
+
+def conversation_detail(chat: Chat) -> Dict[str, Any]:
+    """组装对话详情，会按需加载消息、会话、机构和调查"""
     # 获取消息
     messages = []
     for msg in chat.messages:
@@ -133,12 +159,17 @@ async def get_conversation_detail(
 
 @router.get("/branch_options")
 async def get_branch_options(
+    request: Request,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取分行选项"""
+    """获取分行选项，网点信息变更时失效"""
+    return await response_cache.respond(request, "branch_options", settings.BRANCH_OPTIONS_CACHE_TTL,
+                                        lambda: compute_branch_options(db))
+
+async def compute_branch_options(db: AsyncSession):
     # 从数据库获取所有组织
-    orgs = db.query(Org).all()
+    orgs = (await db.execute(select(Org))).scalars().all()
     
     # 构建组织选项列表
     org_options = []
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Depends
+from security import verify_token
+from database.config import get_pool_stats
+
+router = APIRouter()
+
+@router.get("/pool")
+async def get_pool(current_user = Depends(verify_token)):
+    """获取数据库连接池统计，checked_out长期不归零或suspected_leaks大于0说明有会话未关闭"""
+    return get_pool_stats()
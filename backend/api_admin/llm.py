@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+from security import verify_token
+from inference import inference_service
+from rag import rag_answerer
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_stats(current_user = Depends(verify_token)):
+    """获取大模型推理统计"""
+    stats = inference_service.get_stats()
+    stats["rag"] = rag_answerer.get_stats()
+    return stats
@@ -1,9 +1,9 @@
 from database.models import Org
 from database.crud import org as org_crud
-from database.config import get_db
+from database.config import get_async_db
 from security import verify_token
 from fastapi import Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List, Dict, Any
 from fastapi import APIRouter
 from database.schema import OrgUpdate
@@ -11,6 +11,7 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
 from security import get_password_hash
+from response_cache import response_cache
 
 router = APIRouter(tags=["org"])
 
@@ -20,7 +21,7 @@ async def get_org_list(
     pageSize: int = Query(10, ge=1, le=100),
     keyword: Optional[str] = None,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取网点列表
@@ -30,7 +31,7 @@ async def get_org_list(
     - keyword: 搜索关键词
     """
     # 获取机构列表
-    orgs = org_crud.get_org_list(db, pageSize, pageSize * (page - 1))
+    orgs = await org_crud.get_org_list(db, pageSize, pageSize * (page - 1))
     
     # 搜索处理
     if keyword:
@@ -57,12 +58,12 @@ async def get_org_list(
 async def get_org_detail(
     org_code: str,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取网点详情
     """
-    org = org_crud.getByOrgCode(db, org_code)
+    org = await org_crud.getByOrgCode(db, org_code)
     if not org:
         raise HTTPException(status_code=404, detail=f"网点 {org_code} 不存在")
     
@@ -84,18 +85,19 @@ async def get_org_detail(
 async def update_org(
     org_data: OrgUpdate,
     current_user = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     更新网点信息
     """
-    org = org_crud.getByOrgCode(db, org_data.orgCode)
+    org = await org_crud.getByOrgCode(db, org_data.orgCode)
     if not org:
         raise HTTPException(status_code=404, detail=f"网点 {org_data.orgCode} 不存在")
     
     # 更新组织信息
     update_data = {k: v for k, v in org_data.dict().items() if v is not None}
-    org_crud.update(db, dbObj=org, objIn=update_data)
+    await org_crud.update(db, dbObj=org, objIn=update_data)
+    await response_cache.invalidate("branch_options", "dashboard")
     
     return {"message": "网点信息更新成功"}
 
@@ -104,13 +106,13 @@ class ResetPassword(BaseModel):
     password: str
 
 @router.post("/reset-password")
-async def reset_password(reset_password: ResetPassword, current_user = Depends(verify_token), db: Session = Depends(get_db)):
-    org = org_crud.getByOrgCode(db, reset_password.orgCode)
+async def reset_password(reset_password: ResetPassword, current_user = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    org = await org_crud.getByOrgCode(db, reset_password.orgCode)
     if not org:
         raise HTTPException(status_code=404, detail=f"网点 {reset_password.orgCode} 不存在")
     
     org.password = get_password_hash(reset_password.password)
     org.passwordLastChanged = datetime.now()
     org.isFirstLogin = True 
-    db.commit()
+    await db.commit()
     return {"message": "密码重置成功"}
\ No newline at end of file
@@ -0,0 +1,34 @@
+import base64
+import json
+from typing import Any, Awaitable, Callable, Hashable, List
+
+from fastapi import HTTPException
+
+from cache import list_total_cache
+
+
+def encode_cursor(*values: Any) -> str:
+    """把上一页最后一条记录的排序键编码成游标"""
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """解析游标，格式不对时返回400"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return values
+
+
+async def cached_total(key: Hashable, count: Callable[[], Awaitable[int]]) -> int:
+    """按筛选条件缓存列表总数，翻页时不再重复COUNT"""
+    total = list_total_cache.get(key)
+    if total is None:
+        version = list_total_cache.version
+        total = await count()
+        list_total_cache.set(key, total, version)
+    return total
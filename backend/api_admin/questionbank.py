@@ -1,14 +1,17 @@
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Query
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import pandas as pd
-from database.config import get_db
+from database.config import get_async_db
 from database.models import Topic
 from database.crud import topic as topic_crud
 from security import verify_token
+from search import index_updates
+from api_admin.pagination import encode_cursor, decode_cursor, cached_total
 
 router = APIRouter()
 
@@ -39,30 +42,32 @@ class QuestionResponse(QuestionBase):
 # 1. 获取问题列表
 @router.get("/questions", response_model=List[QuestionResponse])
 async def get_questions(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     current_org = Depends(verify_token),
-    page: int = 1,
-    page_size: int = 10,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100),
     search_text: Optional[str] = None,
-    question_type: Optional[str] = None
+    question_type: Optional[str] = None,
+    cursor: Optional[str] = None
 ):
-    query = db.query(Topic).filter(Topic.isDeleted == False)
-    
-    print("search_text", search_text)
-    if search_text:
-        query = query.filter(
-            (Topic.description.ilike(f"%{search_text}%")) |
-            (Topic.keywords.ilike(f"%{search_text}%")) |
-            (Topic.inTrcd.ilike(f"%{search_text}%")) |
-            (Topic.trcd.ilike(f"%{search_text}%"))
-        )
-    
-    if question_type:
-        query = query.filter(Topic.topicType == question_type)
-    
-    total = query.count()
-    #questions = query.offset((page - 1) * page_size).limit(page_size).all()
-    questions=query.all()
+    """获取题库列表的一页，按(order, id)排序
+
+    总数放在X-Total-Count响应头中，按筛选条件缓存，题库变化时失效；
+    下一页的游标放在X-Next-Cursor中，传回cursor时按键集分页。
+    """
+    filters = dict(searchText=search_text, questionType=question_type)
+    after = None
+    if cursor:
+        order, id = decode_cursor(cursor, 2)
+        if not isinstance(order, int) or not isinstance(id, int):
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+        after = (order, id)
+    questions = await topic_crud.getByFilter(db, skip=(page - 1) * page_size, limit=page_size, after=after, **filters)
+    total = await cached_total(("topics",) + tuple(sorted(filters.items())), lambda: topic_crud.countByFilter(db, **filters))
+    response.headers["X-Total-Count"] = str(total)
+    if len(questions) == page_size:
+        response.headers["X-Next-Cursor"] = encode_cursor(questions[-1].order, questions[-1].id)
     return [
         {
             "id": str(q.id),
@@ -83,7 +88,7 @@ async def get_questions(
 @router.post("/questions", response_model=QuestionResponse)
 async def create_question(
     question: QuestionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_org = Depends(verify_token)
 ):
     db_question = Topic(
@@ -97,8 +102,9 @@ async def create_question(
     )
     
     db.add(db_question)
-    db.commit()
-    db.refresh(db_question)
+    await db.commit()
+    await db.refresh(db_question)
+    index_updates.put(db_question)
     
     return {
         "id": str(db_question.id),
@@ -112,10 +118,10 @@ async def create_question(
 async def update_question(
     question_id: str,
     question: QuestionUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_org = Depends(verify_token)
 ):
-    db_question = db.query(Topic).filter(Topic.id == question_id).first()
+    db_question = await topic_crud.get(db, question_id)
     if not db_question:
         raise HTTPException(status_code=404, detail="Question not found")
     
@@ -127,8 +133,9 @@ async def update_question(
     db_question.addition = question.remark
     db_question.keywords = ",".join(question.keywords)
     
-    db.commit()
-    db.refresh(db_question)
+    await db.commit()
+    await db.refresh(db_question)
+    index_updates.put(db_question)
     
     return {
         "id": str(db_question.id),
@@ -141,15 +148,16 @@ async def update_question(
 @router.delete("/questions/{question_id}")
 async def delete_question(
     question_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_org = Depends(verify_token)
 ):
-    db_question = db.query(Topic).filter(Topic.id == question_id).first()
+    db_question = await topic_crud.get(db, question_id)
     if not db_question:
         raise HTTPException(status_code=404, detail="Question not found")
     
     db_question.isDeleted = True
-    db.commit()
+    await db.commit()
+    index_updates.delete(db_question.topicId)
     
     return {"message": "Question deleted successfully"}
 
@@ -157,7 +165,7 @@ async def delete_question(
 @router.post("/questions/import")
 async def import_questions(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_org = Depends(verify_token)
 ):
     if not file.filename.endswith(('.xlsx', '.xls')):
@@ -170,6 +178,7 @@ async def import_questions(
         if not all(col in df.columns for col in required_columns):
             raise HTTPException(status_code=400, detail="Excel file format is incorrect")
         
+        db_questions = []
         for _, row in df.iterrows():
             db_question = Topic(
                 inTrcd=str(row['入口交易码']),
@@ -181,8 +190,11 @@ async def import_questions(
                 keywords=str(row['关键词']) if pd.notna(row['关键词']) else None
             )
             db.add(db_question)
+            db_questions.append(db_question)
         
-        db.commit()
+        await db.commit()
+        for db_question in db_questions:
+            index_updates.put(db_question)
         return {"message": "Questions imported successfully"}
         
     except Exception as e:
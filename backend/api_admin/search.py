@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from security import verify_token
+from search import get_search_stats, get_index_lag, index_rebuilder
+from cache import topic_map, search_cache, reply_cache
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_stats(current_user = Depends(verify_token)):
+    """获取搜索耗时统计"""
+    stats = get_search_stats()
+    stats["topic_map"] = topic_map.get_stats()
+    stats["search_cache"] = search_cache.get_stats()
+    stats["reply_cache"] = reply_cache.get_stats()
+    return stats
+
+@router.get("/lag")
+async def get_lag(current_user = Depends(verify_token)):
+    """获取题库变更写入索引的延迟"""
+    return get_index_lag()
+
+@router.post("/rebuild")
+async def start_rebuild(current_user = Depends(verify_token)):
+    """后台全量重建索引，重建期间搜索继续使用旧索引"""
+    if not index_rebuilder.start():
+        raise HTTPException(status_code=409, detail="索引正在重建")
+    return {"message": "索引重建已开始"}
+
+@router.get("/rebuild")
+async def get_rebuild_status(current_user = Depends(verify_token)):
+    """获取最近一次重建的状态"""
+    return index_rebuilder.get_status()
@@ -1,16 +1,17 @@
 from fastapi import HTTPException, Depends, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from database.config import get_db
-from database.crud import org, session as session_crud, chat
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.config import get_async_db
+from database.crud import org, session as session_crud, chat, daily_chat_stats
 from security import create_access_token, get_password_hash, verify_password
 from database.schema import SessionCreate, ChatCreate
+from response_cache import response_cache
 
 # 创建路由器
 router = APIRouter()
 
 @router.post("/api/login")
-async def login(data: dict, db: Session = Depends(get_db)):
+async def login(data: dict, db: AsyncSession = Depends(get_async_db)):
     orgCode = data.get("orgCode")
     password = data.get("password")
     contactName = data.get("contactName")
@@ -18,7 +19,7 @@ async def login(data: dict, db: Session = Depends(get_db)):
     contactEhr = data.get("contactEhr")
     
     # 从数据库中获取组织
-    db_org = org.getByOrgCode(db, orgCode)
+    db_org = await org.getByOrgCode(db, orgCode)
     if not db_org or not verify_password(password, db_org.password):
         raise HTTPException(status_code=401, detail="机构号或密码错误")
     
@@ -35,22 +36,25 @@ async def login(data: dict, db: Session = Depends(get_db)):
         db_org.isFirstLogin = False
 
         # 检查组织是否已有会话
-        db_session = session_crud.getByOrg(db, orgCode)
+        db_session = await session_crud.getByOrg(db, orgCode)
         
         # 如果没有会话，创建新会话
         if not db_session:
             session_data = SessionCreate(orgCode=orgCode)
-            db_session = session_crud.create(db, objIn=session_data)
+            db_session = await session_crud.create(db, objIn=session_data)
         
         # 创建新的聊天
         chat_data = ChatCreate(
             sessionId=db_session.sessionId,
             chatName="业务咨询",
         )
-        db_chat = chat.create(db, objIn=chat_data)
+        db_chat = await chat.create(db, objIn=chat_data)
         db.add(db_org)
-    db.commit()
-    db.refresh(db_org)
+    await db.commit()
+    await db.refresh(db_org)
+    if isFirstLogin:
+        await daily_chat_stats.recordChat(db, db_chat, orgCode)
+        await response_cache.invalidate("dashboard")
     
     return {
         "token": create_access_token(data={"sub": db_org.orgCode}),
@@ -61,18 +65,18 @@ async def login(data: dict, db: Session = Depends(get_db)):
     }
 
 @router.post("/api/changePassword")
-async def change_password(data: dict, db: Session = Depends(get_db)):
+async def change_password(data: dict, db: AsyncSession = Depends(get_async_db)):
     orgCode = data.get("orgCode")
     oldPassword = data.get("oldPassword")
     newPassword = data.get("newPassword")
     
     # 验证旧密码
-    db_org = org.getByOrgCode(db, orgCode)
+    db_org = await org.getByOrgCode(db, orgCode)
     if not db_org or not verify_password(oldPassword, db_org.password):
         raise HTTPException(status_code=401, detail="机构号或旧密码错误")
     
     # 更新密码
-    updated_org = org.changePassword(db, orgCode, get_password_hash(newPassword))
+    updated_org = await org.changePassword(db, orgCode, get_password_hash(newPassword))
     if not updated_org:
         raise HTTPException(status_code=401, detail="密码更新失败")
     
@@ -88,7 +92,7 @@ mock_users = [
 ]
 
 @router.post("/api/admin/login")
-async def admin_login(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def admin_login(db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
     # 简单的登录验证，实际环境中应做更强的安全措施
     org_code = form_data.username
     password = form_data.password
@@ -1,13 +1,12 @@
 from fastapi import HTTPException, Depends, APIRouter, Query
 from datetime import datetime, timedelta
 import uvicorn
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
 from pydantic import BaseModel
 from security import verify_token
-from database.config import get_db
-from database.crud import org, session as session_crud, chat, message
-from database.models import Topic
+from database.config import get_async_db
+from database.crud import org, session as session_crud, chat, message, topic as topic_crud
 
 
 # 创建路由器
@@ -15,9 +14,9 @@ router = APIRouter(prefix="/api")
 
 
 @router.get("/hot_topics")
-async def get_hot_topics(db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def get_hot_topics(db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
     # 从数据库获取热门话题
-    db_hot_topics = db.query(Topic).filter(Topic.isDeleted == False).order_by(Topic.order).limit(5).all()
+    db_hot_topics = await topic_crud.getHot(db)
     
     # 转换为前端所需格式
     topics = []
@@ -31,8 +30,8 @@ async def get_hot_topics(db: Session = Depends(get_db), current_org = Depends(ve
     return topics
 
 @router.get("/org/{orgCode}")
-async def get_org_info(orgCode: str, db: Session = Depends(get_db)):
-    db_org = org.getByOrgCode(db, orgCode)
+async def get_org_info(orgCode: str, db: AsyncSession = Depends(get_async_db)):
+    db_org = await org.getByOrgCode(db, orgCode)
     if not db_org:
         raise HTTPException(status_code=404, detail="机构号不存在")
     
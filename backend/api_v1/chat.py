@@ -1,27 +1,61 @@
-from fastapi import HTTPException, Depends, APIRouter
-from database.config import get_db
-from database.crud import chat, message, session as session_crud, org
+from fastapi import HTTPException, Depends, APIRouter, Request
+from fastapi.responses import StreamingResponse
+from database.config import get_async_db, async_session_scope
+from database.crud import chat, message, session as session_crud, org, daily_chat_stats
 from database import schema, models
 from datetime import datetime, timedelta
 from util import mask_sensitive
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from database.crud import topic as topic_crud
-from search import search_topics
+from cache import topic_map, reply_cache, cached_search_topics, normalize_question
 from security import verify_token
+from inference import inference_service, conversation_store, InferenceBusyError
+from rag import rag_answerer
+from response_cache import response_cache
 import json
+import time
+import uuid
 
 router = APIRouter()
 
 default_mock_response_content = "抱歉，我暂时无法理解您的问题。您可以尝试换一种问法，或者咨询人工客服。"
 
-def generate_assistant_reply(user_content: str, db: Session):
+async def search_assistant_reply(user_content: str, db: AsyncSession):
+    """按题库检索回复，返回（回复，补充说明，推荐问题，交给大模型的候选话题）"""
+    # 相同问题（脱敏并规范化后）直接返回缓存的回复
+    key = normalize_question(user_content)
+    cached = reply_cache.get(key)
+    if cached is None:
+        # 计算前记下缓存版本，期间索引提交使缓存失效时不写入旧结果
+        version = reply_cache.version
+        # 话题映射按需从数据库加载，使用同步接口，放在run_sync中执行
+        cached = await db.run_sync(lambda session: _generate_assistant_reply(user_content, session))
+        reply_cache.set(key, cached, version)
+    return cached
+
+async def generate_assistant_reply(user_content: str, db: AsyncSession):
+    final_response_content, additional_prompts, prompts, candidates = await search_assistant_reply(user_content, db)
+    # 检索到多条候选时，最高分达到阈值直接给出答案，否则交给大模型根据候选话题回答；
+    # 大模型不可用时仍返回候选问题列表
+    if candidates and rag_answerer.enabled:
+        topic = rag_answerer.pick(candidates)
+        if topic:
+            return topic["operator"], topic["addition"], []
+        answer = await rag_answerer.answer(user_content, candidates)
+        if answer:
+            return answer, additional_prompts, prompts
+    return final_response_content, additional_prompts, prompts
+
+def _generate_assistant_reply(user_content: str, db: Session):
     user_content = user_content.lower()
     matched_responses = []
-    topic = topic_crud.getByTopicName(db, topicName=user_content)
+    # 精确匹配（如点击热门问题）直接从内存映射返回
+    topic = topic_map.get(db, user_content)
     if topic:
         matched_responses.append(topic)
     else:
-        search_results = search_topics(user_content, 5)
+        search_results = cached_search_topics(user_content, 5)
         if search_results:
             matched_responses = search_results
 
@@ -35,6 +69,7 @@ def generate_assistant_reply(user_content: str, db: Session):
     final_response_content = default_mock_response_content
     additional_prompts = ""
     prompts = []
+    candidates = []
     if not matched_responses:
         pass
     elif len(matched_responses) == 1:
@@ -43,13 +78,14 @@ def generate_assistant_reply(user_content: str, db: Session):
     else:
         final_response_content = "您可能想了解以下哪个问题？请选择或继续提问："
         prompts = [{"description": item["description"]} for item in matched_responses]
-    return final_response_content, additional_prompts, prompts
+        candidates = matched_responses
+    return final_response_content, additional_prompts, prompts, candidates
 
 
-@router.post("/api/message_history/{key}")
-async def save_message_history(key: str, message_data: dict, db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def save_user_message(key: str, message_data: dict, db: AsyncSession) -> str:
+    """保存用户消息，返回脱敏后的内容"""
     # 获取聊天记录
-    db_chat = chat.getByChatId(db, key)
+    db_chat = await chat.getByChatId(db, key)
     if not db_chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
@@ -69,12 +105,14 @@ async def save_message_history(key: str, message_data: dict, db: Session = Depen
         timestamp=now
     )
     db.add(user_db_message)
-    db.commit()
-    db.refresh(user_db_message)
-    
-    # 生成助手回复
-    assistant_content, additional_prompt, prompts = generate_assistant_reply(user_content, db)
-    
+    await db.commit()
+    await db.refresh(user_db_message)
+    conversation_store.append(key, "user", user_content)
+    return user_content
+
+
+async def save_assistant_message(key: str, assistant_content: str, additional_prompt: str, prompts: list, db: AsyncSession, message_id: str = None) -> dict:
+    """保存助手消息，返回前端所需格式"""
     # 创建助手消息
     assistant_db_message = models.Message(
         chatId=key,
@@ -85,9 +123,12 @@ async def save_message_history(key: str, message_data: dict, db: Session = Depen
         status="received",
         timestamp=datetime.now()
     )
+    if message_id:
+        assistant_db_message.messageId = message_id
     db.add(assistant_db_message)
-    db.commit()
-    db.refresh(assistant_db_message)
+    await db.commit()
+    await db.refresh(assistant_db_message)
+    conversation_store.append(key, "assistant", assistant_content)
     
     # 转换为前端所需格式
     assistant_msg = {
@@ -106,15 +147,84 @@ async def save_message_history(key: str, message_data: dict, db: Session = Depen
     return assistant_msg
 
 
+@router.post("/api/message_history/{key}")
+async def save_message_history(key: str, message_data: dict, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
+    user_content = await save_user_message(key, message_data, db)
+    
+    # 生成助手回复
+    assistant_content, additional_prompt, prompts = await generate_assistant_reply(user_content, db)
+    
+    return await save_assistant_message(key, assistant_content, additional_prompt, prompts, db)
+
+
+def _sse(event: str, data: dict) -> str:
+    """格式化一条Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def reply_event_stream(key: str, user_content: str, received_at: float):
+    """生成助手回复的SSE事件流
+
+    先推送start事件，然后推送delta事件，结束后保存助手消息并推送done事件。
+    题库检索到的回复一次推送；交给大模型作答时每生成一段就推送一段。
+    done事件中的ttfb_ms是从收到请求到第一段回复发送出去的耗时，total_ms是到回复保存完成的耗时。
+    流式响应在路由返回后才执行，所以这里单独使用一个数据库会话。
+    """
+    message_id = str(uuid.uuid4())
+    ttfb_ms = None
+    async with async_session_scope() as db:
+        try:
+            yield _sse("start", {"id": message_id, "role": "assistant"})
+            assistant_content, additional_prompt, prompts, candidates = await search_assistant_reply(user_content, db)
+            streamed = []
+            if candidates and rag_answerer.enabled:
+                topic = rag_answerer.pick(candidates)
+                if topic:
+                    assistant_content, additional_prompt, prompts = topic["operator"], topic["addition"], []
+                else:
+                    async for delta in rag_answerer.stream(user_content, candidates):
+                        streamed.append(delta)
+                        yield _sse("delta", {"id": message_id, "content": delta})
+                        # yield返回时这一段已经交给服务器发送
+                        if ttfb_ms is None:
+                            ttfb_ms = (time.perf_counter() - received_at) * 1000
+                    if streamed:
+                        assistant_content = "".join(streamed).strip()
+            if not streamed:
+                # 大模型不可用时仍返回候选问题列表
+                yield _sse("delta", {"id": message_id, "content": assistant_content})
+                ttfb_ms = (time.perf_counter() - received_at) * 1000
+            assistant_msg = await save_assistant_message(key, assistant_content, additional_prompt, prompts, db, message_id=message_id)
+            assistant_msg["ttfb_ms"] = ttfb_ms
+            assistant_msg["total_ms"] = (time.perf_counter() - received_at) * 1000
+            yield _sse("done", assistant_msg)
+        except Exception as e:
+            print(f"生成流式回复出错: {str(e)}")
+            yield _sse("error", {"id": message_id, "detail": str(e)})
+
+
+@router.post("/api/message_history/{key}/stream")
+async def stream_message_history(key: str, message_data: dict, request: Request, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
+    """流式版本的发送消息：先保存用户消息，再以Server-Sent Events推送助手回复"""
+    # 中间件记录的收到请求的时间，首字节耗时包含鉴权和保存用户消息
+    received_at = getattr(request.state, "received_at", time.perf_counter())
+    user_content = await save_user_message(key, message_data, db)
+    return StreamingResponse(
+        reply_event_stream(key, user_content, received_at),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/api/message_history/{key}")
-async def get_message_history(key: str, db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def get_message_history(key: str, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
     # 获取聊天记录
-    db_chat = chat.getByChatId(db, key)
+    db_chat = await chat.getByChatId(db, key)
     if not db_chat:
         return []
     
     # 获取聊天的所有消息
-    db_messages = message.getByChat(db, key)
+    db_messages = await message.getByChat(db, key)
     
     # 转换为前端所需格式
     message_history = []
@@ -132,14 +242,14 @@ async def get_message_history(key: str, db: Session = Depends(get_db), current_o
     return message_history
 
 @router.get("/api/chat/{orgCode}")
-async def get_chats(orgCode: str, db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def get_chats(orgCode: str, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
     # 获取机构对应的会话
-    db_session = session_crud.getByOrg(db, orgCode)
+    db_session = await session_crud.getByOrg(db, orgCode)
     if not db_session:
         return []
     
     # 获取会话中的前5条聊天
-    db_chats = chat.getBySessionTop5(db, db_session.sessionId)
+    db_chats = await chat.getBySessionTop5(db, db_session.sessionId)
     
     # 获取当前日期以进行比较
     today = datetime.now().date()
@@ -171,29 +281,31 @@ async def get_chats(orgCode: str, db: Session = Depends(get_db), current_org = D
     return sessions_list
 
 @router.post("/api/chat")
-async def create_chat(data: dict, db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def create_chat(data: dict, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
     orgCode = data.get("orgCode")
     chatName = data.get("label", f"业务咨询")
     
     # 获取组织
-    db_org = org.getByOrgCode(db, orgCode)
+    db_org = await org.getByOrgCode(db, orgCode)
     if not db_org:
         raise HTTPException(status_code=404, detail="机构不存在")
     
     # 检查组织是否已有会话
-    db_session = session_crud.getByOrg(db, orgCode)
+    db_session = await session_crud.getByOrg(db, orgCode)
     
     # 如果没有会话，创建新会话
     if not db_session:
         session_data = schema.SessionCreate(orgCode=orgCode)
-        db_session = session_crud.create(db, objIn=session_data)
+        db_session = await session_crud.create(db, objIn=session_data)
     
     # 创建新的聊天
     chat_data = schema.ChatCreate(
         sessionId=db_session.sessionId,
         chatName=chatName,
     )
-    db_chat = chat.create(db, objIn=chat_data)
+    db_chat = await chat.create(db, objIn=chat_data)
+    await daily_chat_stats.recordChat(db, db_chat, orgCode)
+    await response_cache.invalidate("dashboard")
     
     # 返回新创建的聊天信息
     return {
@@ -203,15 +315,49 @@ async def create_chat(data: dict, db: Session = Depends(get_db), current_org = D
     }
 
 @router.delete("/api/chat/{key}")
-async def delete_chat(key: str, db: Session = Depends(get_db), current_org = Depends(verify_token)):
+async def delete_chat(key: str, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
     # 获取聊天记录
-    db_chat = chat.getByChatId(db, key)
+    db_chat = await chat.getByChatId(db, key)
     if not db_chat:
         return {"message": "Chat not found or already deleted"}
     
     # 标记删除聊天记录
     db_chat.isDeleted = True
-    db.commit()
-    db.refresh(db_chat)
+    await db.commit()
+    await db.refresh(db_chat)
     
     return {"message": "Chat deleted successfully"}
+
+
+@router.post("/api/llm/chat")
+async def llm_chat(data: dict, db: AsyncSession = Depends(get_async_db), current_org = Depends(verify_token)):
+    """大模型对话：在推理线程中批量生成，路由只等待结果，不阻塞事件循环
+
+    传入chatId时使用并保存该对话的上下文，否则为单轮对话。
+    """
+    if not inference_service.running:
+        raise HTTPException(status_code=503, detail="大模型服务未启用")
+    chat_id = data.get("chatId")
+    max_new_tokens = data.get("maxNewTokens")
+    try:
+        if chat_id:
+            # 先保存用户消息：对话不存在时在这里返回404，不会在上下文缓存中留下空对话；
+            # 已加载的上下文由保存时追加，未加载的从数据库读取时已包含这条消息
+            await save_user_message(chat_id, {"content": data.get("message", "")}, db)
+            conversation = await conversation_store.get(db, chat_id)
+            result = await inference_service.chat(conversation, max_new_tokens)
+            await save_assistant_message(chat_id, result["text"], "", [], db)
+        else:
+            user_content = mask_sensitive(data.get("message", ""))
+            result = await inference_service.generate([{"role": "user", "content": user_content}], max_new_tokens)
+    except InferenceBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {
+        "response": result["text"],
+        "usage": {
+            "promptTokens": result["prompt_tokens"],
+            "generatedTokens": result["generated_tokens"],
+        }
+    }
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import Topic
+from search import index_manager, search_topics
+
+
+def normalize_question(text: str) -> str:
+    """规范化问题文本：去掉首尾空白并转小写"""
+    return text.strip().lower()
+
+
+class TTLCache:
+    """带过期时间的LRU缓存
+
+    invalidate() 会清空缓存并增加版本号，失效前开始计算、失效后才写入的
+    结果会被丢弃，避免把旧数据放回缓存。
+
+    传入generation时，每次查找先取共享的代数（如索引的提交代数）与上次比较，
+    变化时同样清空并增加版本号，其他worker提交的变更也能立即生效。
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float, generation: Optional[Callable[[], Hashable]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = generation
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._version = 0
+        self._seen_generation = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _check_generation(self):
+        """共享代数变化时清空缓存，代数在锁外读取，比较和清空在锁内"""
+        if self.generation is None:
+            return
+        generation = self.generation()
+        with self._lock:
+            if generation != self._seen_generation:
+                if self._data:
+                    self.stale += 1
+                self._data.clear()
+                self._version += 1
+                self._seen_generation = generation
+
+    @property
+    def version(self) -> int:
+        """当前版本号，异步计算时先记下，写入时传给set"""
+        self._check_generation()
+        return self._version
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """取缓存值，不存在或已过期时返回default"""
+        self._check_generation()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None):
+        """写入缓存，version与当前版本不一致时忽略"""
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """命中时返回缓存值，否则计算并写入缓存"""
+        value = self.get(key, self._MISSING)
+        if value is not self._MISSING:
+            return value
+        version = self._version
+        value = compute()
+        self.set(key, value, version)
+        return value
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "stale": self.stale,
+            }
+
+
+class TopicMap:
+    """问题描述到话题的进程内映射
+
+    用户点击热门问题时发送的就是问题描述原文，这类精确匹配直接从内存中
+    返回答案，不再查询数据库或Whoosh。首次使用时加载全部未删除的话题，
+    搜索索引提交（即题库有变更）时失效：本进程提交时由监听器通知，其他进程的提交
+    在每次查找时比较generation发现，另有TTL兜底。
+    """
+
+    def __init__(self, ttl: float, generation: Optional[Callable[[], Hashable]] = None):
+        self.ttl = ttl
+        self.generation = generation
+        self._lock = threading.Lock()
+        self._topics = None
+        self._loaded_at = 0.0
+        self._loaded_generation = None
+        # 每次失效加一，避免把失效前开始加载的旧数据当作最新
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def invalidate(self):
+        """题库变化后调用，下次查询时重新加载"""
+        with self._lock:
+            self._topics = None
+            self._version += 1
+
+    def _load(self, db: Session, generation: Hashable) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            version = self._version
+        rows = db.query(
+            Topic.topicId, Topic.description, Topic.operator, Topic.addition
+        ).filter(Topic.isDeleted == False).order_by(Topic.id).all()
+        topics = {}
+        for topic_id, description, operator, addition in rows:
+            # 描述重复时与按描述查询数据库一样取第一条
+            topics.setdefault(normalize_question(description), {
+                "topicId": topic_id,
+                "description": description,
+                "operator": operator,
+                "addition": addition,
+            })
+        with self._lock:
+            if version == self._version:
+                self._topics = topics
+                self._loaded_at = time.monotonic()
+                self._loaded_generation = generation
+            self.loads += 1
+        return topics
+
+    def get(self, db: Session, text: str) -> Optional[Dict[str, Any]]:
+        """按问题描述精确查找话题"""
+        generation = self.generation() if self.generation is not None else None
+        topics = self._topics
+        if topics is None or generation != self._loaded_generation or time.monotonic() - self._loaded_at > self.ttl:
+            topics = self._load(db, generation)
+        topic = topics.get(normalize_question(text))
+        if topic is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return topic
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        topics = self._topics
+        return {
+            "size": len(topics) if topics is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+        }
+
+
+# 进程内共享的话题映射，索引提交时失效，其他进程的提交在查找时按索引代数发现
+topic_map = TopicMap(settings.TOPIC_MAP_TTL, index_manager.generation)
+index_manager.add_listener(topic_map.invalidate)
+
+
+# 常见问题的搜索结果和回复缓存，键为脱敏并规范化后的问题文本，索引提交（任一进程）时失效
+search_cache = TTLCache(settings.REPLY_CACHE_SIZE, settings.REPLY_CACHE_TTL, index_manager.generation)
+reply_cache = TTLCache(settings.REPLY_CACHE_SIZE, settings.REPLY_CACHE_TTL, index_manager.generation)
+index_manager.add_listener(search_cache.invalidate)
+index_manager.add_listener(reply_cache.invalidate)
+
+# 管理后台列表按筛选条件缓存的总数，题库变化（索引提交）时清空，对话数靠TTL刷新
+list_total_cache = TTLCache(settings.LIST_TOTAL_CACHE_SIZE, settings.LIST_TOTAL_CACHE_TTL, index_manager.generation)
+index_manager.add_listener(list_total_cache.invalidate)
+
+def cached_search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """带缓存的search_topics"""
+    query_string = normalize_question(query_string)
+    return search_cache.get_or_set((query_string, limit), lambda: search_topics(query_string, limit))
@@ -1,36 +1,241 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# transformers和torch只在加载模型时导入，导入本模块本身不加载机器学习依赖
+
+
+class TorchBackend:
+    """transformers + torch fp32 推理"""
+
+    def load(self, model_name: str):
+        from transformers import AutoModelForCausalLM
+        return AutoModelForCausalLM.from_pretrained(model_name)
+
+
+class Int8Backend(TorchBackend):
+    """对所有Linear层做int8动态量化
+
+    权重约为fp32的1/4，CPU上的矩阵乘使用int8内核，生成更快、占用内存更少，精度略有损失。
+    """
+
+    def load(self, model_name: str):
+        import torch
+        model = super().load(model_name)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    """ONNX Runtime 推理，需要安装 optimum[onnxruntime]
+
+    首次加载时把模型导出到模型目录下的onnx子目录，之后直接加载导出结果。
+    """
+
+    def load(self, model_name: str):
+        try:
+            from optimum.onnxruntime import ORTModelForCausalLM
+        except ImportError:
+            raise RuntimeError("LLM_BACKEND=onnx 需要安装 optimum[onnxruntime]")
+        onnx_dir = os.path.join(model_name, "onnx")
+        if os.path.exists(os.path.join(onnx_dir, "model.onnx")):
+            return ORTModelForCausalLM.from_pretrained(onnx_dir)
+        model = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+        model.save_pretrained(onnx_dir)
+        return model
+
+
+# 可选的推理后端，由 LLM_BACKEND 配置选择
+BACKENDS = {
+    "torch": TorchBackend,
+    "int8": Int8Backend,
+    "onnx": OnnxBackend,
+}
+
+
+class TokenStreamer:
+    """model.generate的streamer，批量生成时按行把新生成的文本交给回调
+
+    generate先传入一次提示的token，之后每一步传入各行新生成的一个token。
+    每行累计生成的token并整体解码，把比上次多出的文本交给该行的回调；
+    末尾是不完整的多字节字符时等下一个token再发。callbacks中为None的行不推送，
+    每行最多推送limits中对应数量的token。
+    """
+
+    def __init__(self, tokenizer, callbacks: Sequence[Optional[Callable[[str], None]]], limits: Sequence[int]):
+        self.tokenizer = tokenizer
+        self.callbacks = list(callbacks)
+        self.limits = list(limits)
+        self.ids = [[] for _ in self.callbacks]
+        self.sent = [0] * len(self.callbacks)
+        self._prompt = True
+
+    def put(self, value):
+        if self._prompt:
+            self._prompt = False
+            return
+        for row, token in enumerate(value.reshape(len(self.callbacks), -1).tolist()):
+            if self.callbacks[row] is None or len(self.ids[row]) >= self.limits[row]:
+                continue
+            self.ids[row].extend(token)
+            self._push(row, final=False)
+
+    def end(self):
+        for row in range(len(self.callbacks)):
+            if self.callbacks[row] is not None:
+                self._push(row, final=True)
+
+    def _push(self, row: int, final: bool):
+        text = self.tokenizer.decode(self.ids[row], skip_special_tokens=True)
+        if not final and text.endswith("\ufffd"):
+            return
+        if len(text) > self.sent[row]:
+            delta = text[self.sent[row]:]
+            self.sent[row] = len(text)
+            self.callbacks[row](delta)
+
 
 class QwenChatbot:
-    def __init__(self, model_name="models"):
+    def __init__(self, model_name="models", backend="torch"):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的推理后端: {backend}，可选: {', '.join(BACKENDS)}")
+        from transformers import AutoTokenizer
+        self.backend = backend
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
-        self.history = []
-
-    def generate_response(self, user_input):
-        messages = self.history + [{"role": "user", "content": user_input}]
+        self.model = BACKENDS[backend]().load(model_name)
+        # 批量生成时在左侧填充，使每条提示的末尾对齐
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
 
-        text = self.tokenizer.apply_chat_template(
+    def render(self, messages: List[Dict[str, str]]) -> str:
+        """用对话模板渲染提示文本"""
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
 
-        inputs = self.tokenizer(text, return_tensors="pt")
-        response_ids = self.model.generate(**inputs, max_new_tokens=32768)[0][len(inputs.input_ids[0]):].tolist()
-        response = self.tokenizer.decode(response_ids, skip_special_tokens=True)
+    def encode(self, text: str, prefix_text: str = "", prefix_ids: Sequence[int] = ()) -> List[int]:
+        """把提示文本转换为token ID
+
+        如果文本以之前编码过的prefix_text开头，只编码新增的部分并接在prefix_ids之后。
+        """
+        if prefix_text and text.startswith(prefix_text):
+            return list(prefix_ids) + self.tokenizer(text[len(prefix_text):], add_special_tokens=False).input_ids
+        return self.tokenizer(text, add_special_tokens=False).input_ids
+
+    def generate_response(self, user_input, history: Optional[List[Dict[str, str]]] = None):
+        """单轮生成，history由调用方维护"""
+        history = history if history is not None else []
+        messages = history + [{"role": "user", "content": user_input}]
+        response, _ = self.generate_batch([self.encode(self.render(messages))])[0]
 
         # Update history
-        self.history.append({"role": "user", "content": user_input})
-        self.history.append({"role": "assistant", "content": response})
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": response})
 
         return response
 
+    def generate_batch(self, prompts: List[List[int]], max_new_tokens: int = 512,
+                       max_time: Optional[float] = None, streamer: Optional[TokenStreamer] = None) -> List[Tuple[str, int]]:
+        """对多条已编码的提示一次生成回复，输入填充成同样长度后调用一次generate
+
+        max_time为生成的时间上限（秒），到时停止生成并返回已生成的部分。
+        传入streamer时每生成一步就把新增的文本交给它。
+        返回每条提示的（回复文本，生成的token数）。
+        """
+        inputs = self.tokenizer.pad({"input_ids": prompts}, return_tensors="pt")
+        output_ids = self.model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            max_time=max_time,
+            pad_token_id=self.tokenizer.pad_token_id,
+            streamer=streamer
+        )
+        # 左侧填充后所有提示长度相同，之后的部分就是生成内容
+        prompt_length = inputs["input_ids"].shape[1]
+        results = []
+        for ids in output_ids:
+            generated = ids[prompt_length:]
+            results.append((
+                self.tokenizer.decode(generated, skip_special_tokens=True),
+                int((generated != self.tokenizer.pad_token_id).sum())
+            ))
+        return results
+
+def rss_mb() -> Optional[float]:
+    """当前进程的常驻内存（MB），无法获取时返回None
+
+    Linux读/proc/self/statm；其他平台安装了psutil时用psutil，否则用resource的
+    峰值常驻内存（每个后端在单独的进程中测量，峰值与当前值相差不大）。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss在macOS上单位是字节，Linux等其他平台是KB
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+def benchmark_backend(model_name: str, backend: str, batch_size: int = 4, max_new_tokens: int = 64, rounds: int = 3):
+    """加载一个后端并测量加载耗时、常驻内存和生成速度"""
+    before = rss_mb()
+    start = time.perf_counter()
+    chatbot = QwenChatbot(model_name, backend)
+    load_s = time.perf_counter() - start
+    prompts = [chatbot.encode(chatbot.render([{"role": "user", "content": f"请介绍一下对公账户开户需要准备的材料{i}"}]))
+               for i in range(batch_size)]
+    chatbot.generate_batch(prompts, max_new_tokens=4)
+    tokens = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tokens += sum(n for _, n in chatbot.generate_batch(prompts, max_new_tokens=max_new_tokens))
+    elapsed = time.perf_counter() - start
+    after = rss_mb()
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(after - before, 1) if before is not None and after is not None else None,
+        "tokens_per_s": round(tokens / elapsed, 1),
+    }
+
+
+def run_benchmark(model_name: str, backends: List[str]):
+    """每个后端在单独的进程中测量，互不影响内存统计"""
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        for backend in backends:
+            try:
+                print(pool.apply(benchmark_backend, (model_name, backend)))
+            except Exception as e:
+                print(f"{backend}: {str(e)}")
+
+
 # Example Usage
 if __name__ == "__main__":
+    # python chat.py bench [模型目录] [后端...]：比较各推理后端的生成速度和内存占用
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        run_benchmark(sys.argv[2] if len(sys.argv) > 2 else "models", sys.argv[3:] or list(BACKENDS))
+        sys.exit()
+
     chatbot = QwenChatbot()
+    history = []
 
     while True:
         user_input = input("请输入你的问题：")
-        response = chatbot.generate_response(user_input + " /no_think")
+        response = chatbot.generate_response(user_input + " /no_think", history)
         print(f"Bot: {response}")
-        print("----------------------")
\ No newline at end of file
+        print("----------------------")
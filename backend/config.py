@@ -28,9 +28,15 @@ class Settings(BaseSettings):
     # 数据库配置
     DATABASE_TYPE: str = os.getenv("DATABASE_TYPE", "sqlite")  # sqlite 或 oracle
     
-    # SQLite配置
-    SQLITE_DATABASE_URI: str = f"sqlite:///{BASE_DIR}/../../taizhang.db?check_same_thread=False"
+    # SQLite配置，默认使用 backend/database/app.db
+    SQLITE_DATABASE_URI: str = f"sqlite:///{BASE_DIR}/backend/database/app.db"
     print(SQLITE_DATABASE_URI)
+    # SQLite连接参数：WAL模式下读写互不阻塞；synchronous=NORMAL在WAL下只在检查点时刷盘；
+    # 内存映射读取的上限（字节）；写锁被占用时等待的毫秒数，超时才报database is locked
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     # Oracle配置
     ORACLE_USER: Optional[str] = os.getenv("ORACLE_USER")
@@ -39,12 +45,96 @@ class Settings(BaseSettings):
     ORACLE_PORT: Optional[str] = os.getenv("ORACLE_PORT", "1521")
     ORACLE_SERVICE: Optional[str] = os.getenv("ORACLE_SERVICE")
     
+    # Oracle使用python-oracledb驱动，同步引擎和异步引擎共用一个驱动包
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
         if self.DATABASE_TYPE == "oracle" and all([self.ORACLE_USER, self.ORACLE_PASSWORD, self.ORACLE_SERVICE]):
-            return f"oracle+cx_oracle://{self.ORACLE_USER}:{self.ORACLE_PASSWORD}@{self.ORACLE_HOST}:{self.ORACLE_PORT}/?service_name={self.ORACLE_SERVICE}"
+            return f"oracle+oracledb://{self.ORACLE_USER}:{self.ORACLE_PASSWORD}@{self.ORACLE_HOST}:{self.ORACLE_PORT}/?service_name={self.ORACLE_SERVICE}"
         return self.SQLITE_DATABASE_URI
     
+    # 数据库连接池：常驻连接数、额外连接上限、等待连接的超时（秒）、连接回收周期（秒）、
+    # 借出前探活；连接借出超过DB_POOL_LEAK_SECONDS未归还计为疑似泄漏
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_LEAK_SECONDS: float = 60
+
+    # 管理后台首页的对话日统计：后台按原始表校正的周期（秒），0表示只在启动迁移时统计一次
+    DASHBOARD_STATS_RECONCILE_INTERVAL: float = 3600
+
+    # 搜索预热配置
+    # 是否把问题关键词和交易码加入jieba用户词典（开启后需重建索引，保证索引和查询分词一致）
+    SEARCH_USER_DICT_ENABLED: bool = False
+    # 启动时预热用的查询语句，另外还会使用热门话题的描述
+    SEARCH_WARMUP_QUERIES: List[str] = ["账户开户", "密码重置", "021076"]
+    # 题库变更写入索引的周期（秒）和单批最大文档数
+    SEARCH_INDEX_FLUSH_INTERVAL: float = 1.0
+    SEARCH_INDEX_BATCH_SIZE: int = 500
+    # 全量重建：分页大小、并行分词的进程数、每个进程的内存上限（MB），题库少于PARALLEL_MIN时不启用多进程；
+    # 启用时在单独的spawn子进程中写入，不从服务进程fork
+    SEARCH_REBUILD_PAGE_SIZE: int = 1000
+    SEARCH_REBUILD_PROCS: int = min(4, os.cpu_count() or 1)
+    SEARCH_REBUILD_LIMITMB: int = 128
+    SEARCH_REBUILD_PARALLEL_MIN: int = 2000
+    # 向量检索：与Whoosh结果按权重融合；只由向量召回的话题需要达到最低相似度。
+    # 默认关闭：句向量模型需要torch和约100MB的模型文件，内网部署要先把模型放到本地目录，
+    # 每次查询还要多一次模型推理。开启后新段的向量在后台生成，生成完成前只用Whoosh结果
+    SEARCH_VECTOR_ENABLED: bool = False
+    SEARCH_VECTOR_WEIGHT: float = 0.3
+    SEARCH_VECTOR_MIN_SCORE: float = 0.4
+    # 句向量模型：HuggingFace模型名或本地目录，池化方式为cls（bge系列）或mean，更换后自动重新向量化。
+    # 置空时退回字符n-gram哈希向量（维度为SEARCH_VECTOR_DIM），只能补上分词不一致的漏召回，不理解同义改写
+    SEARCH_EMBEDDING_MODEL: Optional[str] = "BAAI/bge-small-zh-v1.5"
+    SEARCH_EMBEDDING_POOLING: str = "cls"
+    SEARCH_VECTOR_DIM: int = 512
+    # 问题描述精确匹配映射的兜底过期时间（秒），正常情况下在索引提交时失效
+    TOPIC_MAP_TTL: float = 300.0
+    # 常见问题回复缓存的条数和过期时间（秒），索引提交时也会清空
+    REPLY_CACHE_SIZE: int = 1024
+    REPLY_CACHE_TTL: float = 600.0
+    # 管理后台接口的响应缓存：各接口的过期时间（秒）、进程内缓存条数；
+    # 配置RESPONSE_CACHE_URL（如redis://localhost:6379/0）后多个worker共享缓存和失效
+    DASHBOARD_CACHE_TTL: float = 10.0
+    BRANCH_OPTIONS_CACHE_TTL: float = 300.0
+    RESPONSE_CACHE_SIZE: int = 256
+    RESPONSE_CACHE_URL: Optional[str] = None
+    # 对话列表、题库列表的总数缓存（按筛选条件）的条数和过期时间（秒）
+    LIST_TOTAL_CACHE_SIZE: int = 256
+    LIST_TOTAL_CACHE_TTL: float = 30.0
+
+    # 大模型推理配置
+    LLM_ENABLED: bool = False
+    LLM_MODEL_PATH: str = "models"
+    # 推理后端：torch（fp32）、int8（Linear层动态量化）、onnx（ONNX Runtime，需安装optimum[onnxruntime]）
+    # 可用 python chat.py bench 比较各后端的速度和内存
+    LLM_BACKEND: str = "torch"
+    # 推理使用的CPU线程数，0表示使用torch默认值
+    LLM_NUM_THREADS: int = 0
+    # 独立推理进程的地址（如 http://127.0.0.1:8001），设置后各worker不再各自加载模型
+    LLM_SIDECAR_URL: Optional[str] = None
+    # 动态批处理：单批最多请求数、凑批等待时间（毫秒）、排队上限
+    LLM_MAX_BATCH_SIZE: int = 4
+    LLM_BATCH_WAIT_MS: float = 20
+    LLM_QUEUE_SIZE: int = 32
+    # 对话上下文缓存：缓存的token总数上限、空闲多久（秒）后淘汰
+    LLM_CONTEXT_CACHE_TOKENS: int = 2_000_000
+    LLM_CONTEXT_IDLE_SECONDS: float = 1800
+    # token预算：提示最大token数（超出时丢弃最早的对话）、单次生成的token上限、生成截止时间（秒）
+    LLM_MAX_PROMPT_TOKENS: int = 4096
+    LLM_MAX_NEW_TOKENS: int = 512
+    LLM_GENERATION_TIMEOUT: float = 30
+    # 检索增强回答（需启用大模型）：Whoosh最高分达到阈值时直接返回题库答案，否则用前k条话题让模型作答。
+    # 分数是BM25F原始分，与题库规模有关，需按实际数据调整
+    RAG_ENABLED: bool = True
+    RAG_SCORE_THRESHOLD: float = 8.0
+    RAG_TOP_K: int = 3
+    RAG_TOPIC_MAX_CHARS: int = 300
+    RAG_MAX_NEW_TOKENS: int = 256
+    RAG_CACHE_SIZE: int = 1024
+    RAG_CACHE_TTL: float = 3600.0
+
     # Casbin配置
     CASBIN_MODEL_PATH: str = "app/core/rbac_model.conf"
     
@@ -1,7 +1,9 @@
-from .config import Base, engine, SessionLocal, get_db, init_db
+from .config import Base, engine, SessionLocal, get_db, init_db, async_engine, AsyncSessionLocal, get_async_db, session_scope, async_session_scope
 from .models import Session, Chat, Message
 
 __all__ = [
     "Base", "engine", "SessionLocal", "get_db", "init_db",
+    "async_engine", "AsyncSessionLocal", "get_async_db",
+    "session_scope", "async_session_scope",
     "Session", "Chat", "Message",
 ] 
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""同步会话与异步会话的并发吞吐对比
+
+模拟路由的典型访问：按chatId查对话、读取消息、统计数量，中间穿插一次不占CPU的
+等待（如调用下游服务）。"同步"一列是改造前的做法，在async路由里直接使用同步Session，
+查询期间整个事件循环被阻塞；"异步"一列使用AsyncSession。同时用一个定时协程测量
+事件循环的最大延迟。
+
+    python -m database.benchmark [并发数] [每个并发的请求数]
+
+管理后台列表每页执行的SQL语句数由 tests/test_crud.py 检查。
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import select, func
+
+from .config import session_scope, async_session_scope, async_engine, init_db
+from .crud import chat as chat_crud, message as message_crud
+from .models import Chat, Message
+
+
+def sync_request(chat_id: str):
+    with session_scope() as db:
+        db.execute(select(Chat).where(Chat.chatId == chat_id).limit(1)).scalars().first()
+        db.execute(select(Message).where(Message.chatId == chat_id).order_by(Message.id)).scalars().all()
+        db.execute(select(func.count()).select_from(Chat)).scalar_one()
+
+
+async def async_request(chat_id: str):
+    async with async_session_scope() as db:
+        await chat_crud.getByChatId(db, chat_id)
+        await message_crud.getByChat(db, chat_id)
+        await chat_crud.countAll(db)
+
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def run(mode: str, chat_ids: list, concurrency: int, requests: int, io_wait: float):
+    async def worker(n: int):
+        for i in range(requests):
+            chat_id = chat_ids[(n + i) % len(chat_ids)]
+            if mode == "sync":
+                sync_request(chat_id)
+            else:
+                await async_request(chat_id)
+            await asyncio.sleep(io_wait)
+
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    lags.sort()
+    return {
+        "mode": mode,
+        "requests_per_s": round(concurrency * requests / elapsed, 1),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 2) if lags else 0.0,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else 0.0,
+    }
+
+
+async def main(concurrency: int, requests: int):
+    init_db()
+    with session_scope() as db:
+        chat_ids = [chat_id for chat_id, in db.execute(select(Chat.chatId).limit(100)).all()]
+    if not chat_ids:
+        print("数据库中没有对话，请先启动应用并产生一些对话")
+        return
+    for mode in ("sync", "async"):
+        print(await run(mode, chat_ids, concurrency, requests, io_wait=0.005))
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*(args + [50, 20][len(args):])))
@@ -1,14 +1,54 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
 
-# 创建SQLite数据库引擎
+from config import settings
+
+# 连接池参数，同步和异步引擎共用
+POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 print(BASE_DIR)
-SQLALCHEMY_DATABASE_URL = "sqlite:///" + os.path.join(BASE_DIR, "app.db")
+# 数据库URL由配置决定：DATABASE_TYPE=oracle且填写了连接信息时使用Oracle，否则使用SQLite
+SQLALCHEMY_DATABASE_URL = settings.SQLALCHEMY_DATABASE_URI
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+def sqlite_pragmas():
+    """每个新连接上执行的PRAGMA"""
+    return [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+    ]
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+# SQLite连接会跨线程使用（后台线程、线程池），关闭同线程检查
+CONNECT_ARGS = {"check_same_thread": False} if IS_SQLITE else {}
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args=CONNECT_ARGS, poolclass=QueuePool, **POOL_OPTIONS
 )
 
 # 定义索引目录
@@ -18,20 +58,136 @@ if not os.path.exists(INDEX_DIR):
     os.mkdir(INDEX_DIR)
 
 
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "oracle": "oracle+oracledb_async",
+    "oracle+cx_oracle": "oracle+oracledb_async",
+    "oracle+oracledb": "oracle+oracledb_async",
+}
+
+def async_url(url: str):
+    """把同步数据库URL换成对应的异步驱动"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+# 异步引擎：供路由使用，查询时不阻塞事件循环
+async_engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL), **POOL_OPTIONS)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+
+class PoolMonitor:
+    """连接池使用统计
+
+    通过连接池事件记录每个连接的借出时间，借出超过leak_seconds仍未归还的连接
+    计为疑似泄漏，在连接池耗尽之前就能从统计中看到。
+    """
+
+    def __init__(self, name: str, pool, leak_seconds: float):
+        self.name = name
+        self.pool = pool
+        self.leak_seconds = leak_seconds
+        self._lock = threading.Lock()
+        # 连接记录 -> 借出时间
+        self._checked_out = {}
+        self.stats = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidated": 0}
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.stats["connects"] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self._checked_out[id(connection_record)] = time.monotonic()
+            self.stats["checkouts"] += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._checked_out.pop(id(connection_record), None)
+            self.stats["checkins"] += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.stats["invalidated"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池当前状态和累计统计"""
+        now = time.monotonic()
+        with self._lock:
+            held = [now - checked_out_at for checked_out_at in self._checked_out.values()]
+            stats = dict(self.stats)
+        stats.update(
+            pool_size=self.pool.size(),
+            checked_in=self.pool.checkedin(),
+            checked_out=self.pool.checkedout(),
+            overflow=self.pool.overflow(),
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            longest_checkout_seconds=max(held, default=0.0),
+            suspected_leaks=sum(1 for seconds in held if seconds > self.leak_seconds),
+        )
+        return stats
+
+
+pool_monitors = [
+    PoolMonitor("sync", engine.pool, settings.DB_POOL_LEAK_SECONDS),
+    PoolMonitor("async", async_engine.sync_engine.pool, settings.DB_POOL_LEAK_SECONDS),
+]
+
+def get_pool_stats() -> Dict[str, Any]:
+    """获取同步和异步连接池的使用统计"""
+    return {monitor.name: monitor.get_stats() for monitor in pool_monitors}
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 异步会话工厂：提交后不过期对象，避免提交后访问属性时隐式查询
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # 创建基础模型类
 Base = declarative_base()
 
-# 获取数据库会话
-def get_db():
+@contextmanager
+def session_scope():
+    """同步会话的上下文管理器，出错时回滚，退出时总是关闭并归还连接
+
+    启动初始化、后台线程和命令行工具都应通过它使用会话，不要直接调用get_db()。
+    """
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
-# 初始化数据库
+@asynccontextmanager
+async def async_session_scope():
+    """异步会话的上下文管理器，用于路由依赖之外（如流式响应）"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+# 获取数据库会话（同步依赖）
+def get_db():
+    with session_scope() as db:
+        yield db
+
+# 获取异步数据库会话（路由依赖）
+async def get_async_db():
+    async with async_session_scope() as db:
+        yield db
+
+# 初始化数据库：创建缺少的表，再执行未完成的结构迁移（如已有表上新增的索引）
 def init_db():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    from .migrations import upgrade
+    Base.metadata.create_all(bind=engine)
+    upgrade(engine) 
\ No newline at end of file
@@ -1,9 +1,11 @@
-from sqlalchemy.orm import Session, aliased
-from sqlalchemy import func, distinct, exists, and_, not_
-from typing import List, Optional, Dict, Any, Type, TypeVar, Generic
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from sqlalchemy import select, update, func, distinct, exists, and_, not_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import List, Optional, Dict, Any, Tuple, Type, TypeVar, Generic
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-from .models import Org, Session as SessionModel, Chat as ChatModel, Message as MessageModel, Topic as TopicModel, Survey as SurveyModel, Contact as ContactModel
+from datetime import date, datetime, timedelta
+from .models import Org, Session as SessionModel, Chat as ChatModel, Message as MessageModel, Topic as TopicModel, Survey as SurveyModel, Contact as ContactModel, DailyChatStats as DailyChatStatsModel
 
 # 定义泛型类型变量
 T = TypeVar('T')
@@ -24,31 +26,47 @@ class CRUDBase(Generic[ModelType, CreateSchemaType]):
             model: SQLAlchemy模型类
         """
         self.model = model
+
+    async def first(self, db: AsyncSession, stmt) -> Optional[ModelType]:
+        """执行查询并返回第一条记录"""
+        return (await db.execute(stmt.limit(1))).scalars().first()
+
+    async def all(self, db: AsyncSession, stmt) -> List[ModelType]:
+        """执行查询并返回所有记录"""
+        return list((await db.execute(stmt)).scalars().all())
+
+    def countQuery(self, *criteria):
+        """统计满足条件的记录数的语句"""
+        return select(func.count()).select_from(self.model).where(*criteria)
+
+    async def count(self, db: AsyncSession, *criteria) -> int:
+        """统计满足条件的记录数"""
+        return (await db.execute(self.countQuery(*criteria))).scalar_one()
     
-    def get(self, db: Session, id: str) -> Optional[ModelType]:
+    async def get(self, db: AsyncSession, id: str) -> Optional[ModelType]:
         """
         通过ID获取记录
         """
-        return db.query(self.model).filter(self.model.id == id).first()
+        return await self.first(db, select(self.model).where(self.model.id == id))
     
-    def getMulti(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[ModelType]:
+    async def getMulti(self, db: AsyncSession, *, skip: int = 0, limit: int = 100) -> List[ModelType]:
         """
         获取多条记录
         """
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return await self.all(db, select(self.model).offset(skip).limit(limit))
     
-    def create(self, db: Session, *, objIn: CreateSchemaType) -> ModelType:
+    async def create(self, db: AsyncSession, *, objIn: CreateSchemaType) -> ModelType:
         """
         创建新记录
         """
         objInData = objIn.dict()
         dbObj = self.model(**objInData)
         db.add(dbObj)
-        db.commit()
-        db.refresh(dbObj)
+        await db.commit()
+        await db.refresh(dbObj)
         return dbObj
     
-    def update(self, db: Session, *, dbObj: ModelType, objIn: Dict[str, Any]) -> ModelType:
+    async def update(self, db: AsyncSession, *, dbObj: ModelType, objIn: Dict[str, Any]) -> ModelType:
         """
         更新记录
         """
@@ -56,41 +74,41 @@ class CRUDBase(Generic[ModelType, CreateSchemaType]):
             if hasattr(dbObj, field):
                 setattr(dbObj, field, objIn[field])
         db.add(dbObj)
-        db.commit()
-        db.refresh(dbObj)
+        await db.commit()
+        await db.refresh(dbObj)
         return dbObj
     
-    def remove(self, db: Session, *, id: str) -> ModelType:
+    async def remove(self, db: AsyncSession, *, id: str) -> ModelType:
         """
         删除记录
         """
-        obj = db.query(self.model).get(id)
-        db.delete(obj)
-        db.commit()
+        obj = await db.get(self.model, id)
+        await db.delete(obj)
+        await db.commit()
         return obj
 
 
 class CRUDOrg(CRUDBase[Org, CreateSchemaType]):
     """组织CRUD操作"""
     
-    def get_org_list(self, db: Session, limit: int = 100, skip: int = 0) -> List[Org]:
+    async def get_org_list(self, db: AsyncSession, limit: int = 100, skip: int = 0) -> List[Org]:
         """获取组织列表，带分页功能"""
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return await self.all(db, select(self.model).offset(skip).limit(limit))
     
-    def getByOrgCode(self, db: Session, orgCode: str) -> Optional[Org]:
+    async def getByOrgCode(self, db: AsyncSession, orgCode: str) -> Optional[Org]:
         """通过orgCode获取组织"""
-        return db.query(self.model).filter(self.model.orgCode == orgCode).first()
+        return await self.first(db, select(self.model).where(self.model.orgCode == orgCode))
     
-    def changePassword(self, db: Session, orgCode: str, newPassword: str) -> Optional[Org]:
+    async def changePassword(self, db: AsyncSession, orgCode: str, newPassword: str) -> Optional[Org]:
         """更改组织密码"""
-        org = self.getByOrgCode(db, orgCode)
+        org = await self.getByOrgCode(db, orgCode)
         if org:
             org.password = newPassword
             org.passwordLastChanged = datetime.now()
             org.isFirstLogin = False
             db.add(org)
-            db.commit()
-            db.refresh(org)
+            await db.commit()
+            await db.refresh(org)
         return org
     
 
@@ -98,40 +116,43 @@ class CRUDOrg(CRUDBase[Org, CreateSchemaType]):
 class CRUDSession(CRUDBase[SessionModel, CreateSchemaType]):
     """会话CRUD操作"""
     
-    def getBySessionId(self, db: Session, sessionId: str) -> Optional[SessionModel]:
+    async def getBySessionId(self, db: AsyncSession, sessionId: str) -> Optional[SessionModel]:
         """通过sessionId获取会话"""
-        return db.query(self.model).filter(self.model.sessionId == sessionId).first()
+        return await self.first(db, select(self.model).where(self.model.sessionId == sessionId))
     
-    def getByOrg(self, db: Session, orgCode: str) -> Optional[SessionModel]:
+    async def getByOrg(self, db: AsyncSession, orgCode: str) -> Optional[SessionModel]:
         """获取组织的会话（一个组织只有一个会话）"""
-        return db.query(self.model).filter(self.model.orgCode == orgCode).filter(self.model.isDeleted == False).first()
+        return await self.first(db, select(self.model).where(self.model.orgCode == orgCode).where(self.model.isDeleted == False))
     
 
 class CRUDChat(CRUDBase[ChatModel, CreateSchemaType]):
     """对话CRUD操作"""
 
-    def countAll(self, db: Session) -> int:
+    async def countAll(self, db: AsyncSession) -> int:
         """获取所有对话的数量"""
-        return db.query(self.model).count()
+        return await self.count(db)
     
-    def getByDayCount(self, db: Session, day: datetime) -> int:
+    def getByDayCountQuery(self, day: datetime):
+        return self.countQuery(self.model.createdAt >= day, self.model.createdAt <= day + timedelta(days=1))
+
+    async def getByDayCount(self, db: AsyncSession, day: datetime) -> int:
         """获取指定日期的对话数量"""
-        return db.query(self.model).filter(self.model.createdAt >= day).filter(self.model.createdAt <= day + timedelta(days=1)).count()
+        return (await db.execute(self.getByDayCountQuery(day))).scalar_one()
 
-    def countToday(self, db: Session) -> int:
+    async def countToday(self, db: AsyncSession) -> int:
         """获取今日对话的数量"""
         today = datetime.now().date()
-        return db.query(self.model).filter(self.model.createdAt >= today).count()
+        return await self.count(db, self.model.createdAt >= today)
     
-    def getByChatId(self, db: Session, chatId: str) -> Optional[ChatModel]:
+    async def getByChatId(self, db: AsyncSession, chatId: str) -> Optional[ChatModel]:
         """通过chatId获取对话"""
-        return db.query(self.model).filter(self.model.chatId == chatId).first()
+        return await self.first(db, select(self.model).where(self.model.chatId == chatId))
     
-    def getByOrgCodeTop7(self, db: Session) -> List[Dict[str, Any]]:
+    async def getByOrgCodeTop7(self, db: AsyncSession) -> List[Dict[str, Any]]:
         """获取对话数最多的5个机构的机构号及对话数"""
         # 通过会话表的orgCode进行分组和计数
         SessionAlias = aliased(SessionModel)
-        result = db.query(
+        result = (await db.execute(select(
             SessionAlias.orgCode, 
             func.count(distinct(self.model.chatId)).label('chat_count')
         ).join(
@@ -141,19 +162,20 @@ class CRUDChat(CRUDBase[ChatModel, CreateSchemaType]):
             SessionAlias.orgCode,
         ).order_by(
             func.count(distinct(self.model.chatId)).desc()
-        ).limit(7).all()
+        ).limit(7))).all()
         
         # 转换结果为字典列表
         return [{"orgCode": org_code, "count": count} for org_code, count in result]
     
-    def getBySessionTop5(self, db: Session, sessionId: str) -> List[ChatModel]:
-        """获取会话的所有对话"""
-        return db.query(self.model).filter(self.model.sessionId == sessionId).filter(self.model.isDeleted == False).order_by(self.model.createdAt.desc()).limit(20).all()
+    def getBySessionTop5Query(self, sessionId: str):
+        return select(self.model).where(self.model.sessionId == sessionId).where(self.model.isDeleted == False).order_by(self.model.createdAt.desc()).limit(20)
 
-    def getByFilter(self, db: Session, *, skip: int = 0, limit: int = 100, orgCode: Optional[str] = None, startDate: Optional[str] = None, endDate: Optional[str] = None, searchTerm: Optional[str] = None, solvedFilter: Optional[str] = None) -> List[ChatModel]:
-        """通过过滤条件获取会话"""
-        query = db.query(self.model)
+    async def getBySessionTop5(self, db: AsyncSession, sessionId: str) -> List[ChatModel]:
+        """获取会话的所有对话"""
+        return await self.all(db, self.getBySessionTop5Query(sessionId))
 
+    def filterQuery(self, query, *, orgCode: Optional[str] = None, startDate: Optional[str] = None, endDate: Optional[str] = None, searchTerm: Optional[str] = None, solvedFilter: Optional[str] = None):
+        """给对话查询加上管理后台列表的筛选条件"""
         if orgCode:
             # 通过会话关联表来筛选机构代码
             query = query.join(SessionModel, SessionModel.sessionId == self.model.sessionId).filter(SessionModel.orgCode == orgCode)
@@ -210,66 +232,224 @@ class CRUDChat(CRUDBase[ChatModel, CreateSchemaType]):
                 
                 # 使用exists()的方式来查询
                 query = query.filter(exists_query)
-                
-        # 按创建时间倒序排序
-        query = query.order_by(self.model.createdAt.desc())
-        
-        return query.offset(skip).limit(limit).all()
+
+        return query
+
+    def getByFilterQuery(self, *, skip: int = 0, limit: int = 100, before: Optional[Tuple[datetime, int]] = None, **filters):
+        """管理后台对话列表一页的查询语句，参数同getByFilter"""
+        query = self.filterQuery(select(self.model).options(
+            joinedload(self.model.session).joinedload(SessionModel.organization),
+            selectinload(self.model.survey),
+        ), **filters)
+        if before is not None:
+            created_at, id = before
+            # 第一个条件可以直接用索引定位，Oracle也不支持行值比较
+            query = query.filter(self.model.createdAt <= created_at).filter(
+                (self.model.createdAt < created_at) | (self.model.id < id))
+        else:
+            query = query.offset(skip)
+        return query.order_by(self.model.createdAt.desc(), self.model.id.desc()).limit(limit)
+
+    async def getByFilter(self, db: AsyncSession, *, skip: int = 0, limit: int = 100, before: Optional[Tuple[datetime, int]] = None, **filters) -> List[ChatModel]:
+        """通过过滤条件获取会话，按(createdAt, id)倒序
+
+        before为上一页最后一条的(createdAt, id)时按键集分页，直接从索引定位，
+        翻到多深都与第一页开销相同；否则按skip偏移。
+        会话、机构随主查询一起JOIN加载，调查用一条IN查询批量加载，
+        无论分页大小都是固定的两条语句，不会在访问关联对象时逐条查询。
+        """
+        return await self.all(db, self.getByFilterQuery(skip=skip, limit=limit, before=before, **filters))
+
+    def countByFilterQuery(self, **filters):
+        query = self.filterQuery(select(self.model.id), **filters)
+        return select(func.count()).select_from(query.subquery())
+
+    async def countByFilter(self, db: AsyncSession, **filters) -> int:
+        """满足筛选条件的对话总数"""
+        return (await db.execute(self.countByFilterQuery(**filters))).scalar_one()
     
     
 
 class CRUDMessage(CRUDBase[MessageModel, CreateSchemaType]):
     """消息CRUD操作"""
     
-    def getByMessageId(self, db: Session, messageId: str) -> Optional[MessageModel]:
+    async def getByMessageId(self, db: AsyncSession, messageId: str) -> Optional[MessageModel]:
         """通过messageId获取消息"""
-        return db.query(self.model).filter(self.model.messageId == messageId).first()
+        return await self.first(db, select(self.model).where(self.model.messageId == messageId))
     
-    def getByChat(self, db: Session, chatId: str) -> List[MessageModel]:
-        """获取对话的所有消息"""
-        return db.query(self.model).filter(self.model.chatId == chatId).all()
+    def getByChatQuery(self, chatId: str):
+        return select(self.model).where(self.model.chatId == chatId).order_by(self.model.id)
+
+    async def getByChat(self, db: AsyncSession, chatId: str) -> List[MessageModel]:
+        """获取对话的所有消息，按发送顺序排列"""
+        return await self.all(db, self.getByChatQuery(chatId))
     
 
 class CRUDTopic(CRUDBase[TopicModel, CreateSchemaType]):
     """话题CRUD操作"""
 
-    def countAll(self, db: Session) -> int:
+    async def countAll(self, db: AsyncSession) -> int:
         """获取所有话题的数量"""
-        return db.query(self.model).count()
+        return await self.count(db)
     
-    def getByTopicId(self, db: Session, topicId: str) -> Optional[TopicModel]:
+    async def getByTopicId(self, db: AsyncSession, topicId: str) -> Optional[TopicModel]:
         """通过topicId获取话题"""
-        return db.query(self.model).filter(self.model.topicId == topicId).first()
+        return await self.first(db, select(self.model).where(self.model.topicId == topicId))
     
-    def getByTopicName(self, db: Session, topicName: str) -> Optional[TopicModel]:
+    def getByTopicNameQuery(self, topicName: str):
+        return select(self.model).where(self.model.description == topicName).where(self.model.isDeleted == False).limit(1)
+
+    async def getByTopicName(self, db: AsyncSession, topicName: str) -> Optional[TopicModel]:
         """通过topicName获取话题"""
-        return db.query(self.model).filter(self.model.description == topicName).first()
+        return await self.first(db, self.getByTopicNameQuery(topicName))
+
+    def getHotQuery(self, limit: int = 5):
+        return select(self.model).where(self.model.isDeleted == False).order_by(self.model.order).limit(limit)
+
+    async def getHot(self, db: AsyncSession, limit: int = 5) -> List[TopicModel]:
+        """首页的热门话题，按order排序"""
+        return await self.all(db, self.getHotQuery(limit))
     
-    def getAllOrderedByOrder(self, db: Session) -> List[TopicModel]:
+    async def getAllOrderedByOrder(self, db: AsyncSession) -> List[TopicModel]:
         """获取所有话题，按order字段排序"""
-        return db.query(self.model).order_by(self.model.order).all()
+        return await self.all(db, select(self.model).order_by(self.model.order))
+
+    def filterQuery(self, query, *, searchText: Optional[str] = None, questionType: Optional[str] = None):
+        """题库列表的筛选条件：未删除，按关键字和问题类型筛选"""
+        query = query.where(self.model.isDeleted == False)
+        if searchText:
+            query = query.filter(
+                (self.model.description.ilike(f"%{searchText}%")) |
+                (self.model.keywords.ilike(f"%{searchText}%")) |
+                (self.model.inTrcd.ilike(f"%{searchText}%")) |
+                (self.model.trcd.ilike(f"%{searchText}%"))
+            )
+        if questionType:
+            query = query.filter(self.model.topicType == questionType)
+        return query
+
+    def getByFilterQuery(self, *, skip: int = 0, limit: int = 10, after: Optional[Tuple[int, int]] = None, **filters):
+        """题库列表一页的查询语句，参数同getByFilter"""
+        query = self.filterQuery(select(self.model), **filters)
+        if after is not None:
+            order, id = after
+            query = query.filter(self.model.order >= order).filter(
+                (self.model.order > order) | (self.model.id > id))
+        else:
+            query = query.offset(skip)
+        return query.order_by(self.model.order, self.model.id).limit(limit)
+
+    async def getByFilter(self, db: AsyncSession, *, skip: int = 0, limit: int = 10, after: Optional[Tuple[int, int]] = None, **filters) -> List[TopicModel]:
+        """题库列表的一页，按(order, id)排序
+
+        after为上一页最后一条的(order, id)时按键集分页，否则按skip偏移。
+        """
+        return await self.all(db, self.getByFilterQuery(skip=skip, limit=limit, after=after, **filters))
+
+    def countByFilterQuery(self, **filters):
+        query = self.filterQuery(select(self.model.id), **filters)
+        return select(func.count()).select_from(query.subquery())
+
+    async def countByFilter(self, db: AsyncSession, **filters) -> int:
+        """满足筛选条件的话题总数"""
+        return (await db.execute(self.countByFilterQuery(**filters))).scalar_one()
 
 
 class CRUDSurvey(CRUDBase[SurveyModel, CreateSchemaType]):
     """调查CRUD操作"""
 
-    def getBySurveyId(self, db: Session, surveyId: str) -> Optional[SurveyModel]:
+    async def getBySurveyId(self, db: AsyncSession, surveyId: str) -> Optional[SurveyModel]:
         """通过surveyId获取调查"""
-        return db.query(self.model).filter(self.model.surveyId == surveyId).first()
+        return await self.first(db, select(self.model).where(self.model.surveyId == surveyId))
     
-    def getAllN0SurveyCount(self, db: Session) -> int:
+    def getAllN0SurveyCountQuery(self):
+        return self.countQuery(self.model.solved == "no")
+
+    async def getAllN0SurveyCount(self, db: AsyncSession) -> int:
         """获取所有调查的数量"""
-        return db.query(self.model).filter(self.model.solved == "no").count()
+        return (await db.execute(self.getAllN0SurveyCountQuery())).scalar_one()
+
+    def getByChatIdQuery(self, chatId: str):
+        return select(self.model).where(self.model.chatId == chatId).order_by(self.model.createdAt.desc()).limit(1)
     
-    def getByChatId(self, db: Session, chatId: str) -> List[SurveyModel]:
+    async def getByChatId(self, db: AsyncSession, chatId: str) -> List[SurveyModel]:
         """获取对话的最新调查"""
-        return db.query(self.model).filter(self.model.chatId == chatId).order_by(self.model.createdAt.desc()).limit(1).all()
+        return await self.all(db, self.getByChatIdQuery(chatId))
 
 class CRUDContact(CRUDBase[ContactModel, CreateSchemaType]):
 
-    def getAllContact(self, db: Session) -> List[ContactModel]:
+    async def getAllContact(self, db: AsyncSession) -> List[ContactModel]:
         """获取所有联系人"""
-        return db.query(self.model).all()
+        return await self.all(db, select(self.model))
+
+
+class CRUDDailyChatStats(CRUDBase[DailyChatStatsModel, CreateSchemaType]):
+    """对话日统计CRUD操作
+
+    统计在对话、调查提交之后单独更新和提交，出错只打印日志，不影响业务写入；
+    偏差由定时校正任务（database/stats.py）修正。
+    """
+
+    async def increment(self, db: AsyncSession, day: date, orgCode: str, chats: int = 0, unsolved: int = 0):
+        """累加某天某机构的计数，行不存在时插入"""
+        if db.get_bind().dialect.name == "sqlite":
+            stmt = sqlite_insert(self.model).values(day=day, orgCode=orgCode, chats=chats, unsolved=unsolved)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.day, self.model.orgCode],
+                set_={"chats": self.model.chats + chats, "unsolved": self.model.unsolved + unsolved},
+            )
+            await db.execute(stmt)
+            return
+        result = await db.execute(update(self.model).where(self.model.day == day, self.model.orgCode == orgCode).values(
+            chats=self.model.chats + chats, unsolved=self.model.unsolved + unsolved))
+        if not result.rowcount:
+            db.add(self.model(day=day, orgCode=orgCode, chats=chats, unsolved=unsolved))
+
+    async def _record(self, db: AsyncSession, day: date, orgCode: str, **counts):
+        try:
+            await self.increment(db, day, orgCode, **counts)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            print(f"更新对话日统计出错: {str(e)}")
+
+    async def recordChat(self, db: AsyncSession, chat: ChatModel, orgCode: str):
+        """新建对话后调用"""
+        await self._record(db, chat.createdAt.date(), orgCode, chats=1)
+
+    async def recordSurvey(self, db: AsyncSession, survey: SurveyModel):
+        """提交调查后调用，只统计未解决的调查"""
+        if survey.solved != "no":
+            return
+        orgCode = (await db.execute(select(SessionModel.orgCode).join(
+            ChatModel, ChatModel.sessionId == SessionModel.sessionId
+        ).where(ChatModel.chatId == survey.chatId).limit(1))).scalar()
+        if orgCode:
+            await self._record(db, survey.createdAt.date(), orgCode, unsolved=1)
+
+    async def countChats(self, db: AsyncSession) -> int:
+        """所有对话的数量"""
+        return (await db.execute(select(func.coalesce(func.sum(self.model.chats), 0)))).scalar_one()
+
+    def getOrgTotalsQuery(self):
+        return select(
+            self.model.orgCode, func.sum(self.model.chats), func.sum(self.model.unsolved)
+        ).group_by(self.model.orgCode)
+
+    async def getOrgTotals(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """各机构的对话总数和未解决调查总数"""
+        result = await db.execute(self.getOrgTotalsQuery())
+        return [{"orgCode": org_code, "count": chats, "unsolved": unsolved} for org_code, chats, unsolved in result.all()]
+
+    def getDailyCountsQuery(self, since: date):
+        return select(
+            self.model.day, func.sum(self.model.chats)
+        ).where(self.model.day >= since).group_by(self.model.day)
+
+    async def getDailyCounts(self, db: AsyncSession, since: date) -> Dict[date, int]:
+        """从since开始每天的对话数（所有机构合计）"""
+        result = await db.execute(self.getDailyCountsQuery(since))
+        return dict(result.all())
 
 
 # 创建CRUD实例
@@ -279,4 +459,5 @@ chat = CRUDChat(ChatModel)
 message = CRUDMessage(MessageModel)
 topic = CRUDTopic(TopicModel)
 survey = CRUDSurvey(SurveyModel)
-contact = CRUDContact(ContactModel)
\ No newline at end of file
+contact = CRUDContact(ContactModel)
+daily_chat_stats = CRUDDailyChatStats(DailyChatStatsModel)
\ No newline at end of file
@@ -144,7 +144,4 @@ def init_all_data(db: Session):
     init_org_data(db)
     init_hot_topics(db)
     init_contacts(db)
-    
-    # 导入在这里避免循环导入
-    from search import init_search_index
-    init_search_index(db) 
\ No newline at end of file
+    # 搜索索引在启动预热阶段初始化，见 search.warm_up_search 
\ No newline at end of file
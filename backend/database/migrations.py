@@ -0,0 +1,173 @@
+"""数据库结构迁移
+
+create_all只会创建缺少的表，已有的表上新增索引、字段不会生效。这里按版本号顺序
+记录结构变更，已执行的版本写入schema_migrations表，启动时（init_db）只执行
+尚未执行的版本。新增变更时在MIGRATIONS末尾追加一项，不要修改已发布的版本。
+
+    python -m database.migrations            # 执行未完成的迁移
+    python -m database.migrations status     # 查看各版本的执行情况
+    python -m database.migrations check      # 打印热点查询的执行计划，有全表扫描时退出码为1
+
+tests/test_migrations.py 在写入数据的测试库上检查同样的执行计划。
+"""
+import sys
+from datetime import date, datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, select, text
+
+from . import crud
+from .config import Base, engine
+from .stats import reconcile
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("appliedAt", DateTime, nullable=False),
+)
+
+
+def create_indexes(*definitions: Tuple[str, ...]) -> Callable:
+    """创建(表名, 索引名, 列名...)对应的索引，已存在的跳过（新库由create_all建好）
+
+    索引定义写在迁移里而不是取自模型，模型中的索引以后改名或调整列时，
+    已发布版本执行的内容不会随之改变。
+    """
+    def upgrade(conn):
+        for table, name, *columns in definitions:
+            table = Table(table, MetaData(), *(Column(column) for column in columns))
+            Index(name, *(table.c[column] for column in columns)).create(conn, checkfirst=True)
+    return upgrade
+
+
+def drop_indexes(*names: Tuple[str, str]) -> Callable:
+    """删除(表名, 索引名)对应的索引，不存在的跳过"""
+    def upgrade(conn):
+        inspector = inspect(conn)
+        for table, name in names:
+            if name in {index["name"] for index in inspector.get_indexes(table)}:
+                conn.execute(text(f'DROP INDEX "{name}"'))
+    return upgrade
+
+
+def steps(*migrations: Callable) -> Callable:
+    """在同一个事务中依次执行多个步骤"""
+    def upgrade(conn):
+        for migration in migrations:
+            migration(conn)
+    return upgrade
+
+
+# (版本号, 说明, 执行函数)
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "hot query indexes", create_indexes(
+        ("chats", "ix_chats_sessionId_createdAt", "sessionId", "createdAt"),
+        ("chats", "ix_chats_createdAt", "createdAt"),
+        ("messages", "ix_messages_chatId_id", "chatId", "id"),
+        ("surveys", "ix_surveys_chatId_solved", "chatId", "solved"),
+        ("surveys", "ix_surveys_solved", "solved"),
+        ("topics", "ix_topics_description_isDeleted", "description", "isDeleted"),
+        ("topics", "ix_topics_isDeleted_order", "isDeleted", "order"),
+    )),
+    (2, "backfill daily chat stats", reconcile),
+    (3, "keyset pagination indexes", steps(
+        drop_indexes(("chats", "ix_chats_createdAt"), ("topics", "ix_topics_isDeleted_order")),
+        create_indexes(("chats", "ix_chats_createdAt_id", "createdAt", "id"),
+                       ("topics", "ix_topics_isDeleted_order_id", "isDeleted", "order", "id")),
+    )),
+]
+
+
+def applied_versions(conn) -> Dict[int, datetime]:
+    return dict(conn.execute(select(schema_migrations.c.version, schema_migrations.c.appliedAt)).all())
+
+
+def upgrade(bind=engine) -> List[int]:
+    """执行未完成的迁移，每个版本一个事务，返回本次执行的版本号"""
+    migration_metadata.create_all(bind=bind)
+    with bind.connect() as conn:
+        done = applied_versions(conn)
+    executed = []
+    for version, name, run in MIGRATIONS:
+        if version in done:
+            continue
+        with bind.begin() as conn:
+            run(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name, appliedAt=datetime.now()))
+        print(f"数据库迁移 {version} {name} 完成")
+        executed.append(version)
+    return executed
+
+
+def status(bind=engine) -> List[Dict]:
+    migration_metadata.create_all(bind=bind)
+    with bind.connect() as conn:
+        done = applied_versions(conn)
+    return [{"version": version, "name": name, "appliedAt": done.get(version)} for version, name, _ in MIGRATIONS]
+
+
+def hot_queries() -> Dict[str, object]:
+    """CRUD中的热点查询，直接使用database/crud.py中构造查询语句的方法"""
+    day = datetime(2024, 1, 1)
+    return {
+        "chat.getBySessionTop5": crud.chat.getBySessionTop5Query("s"),
+        "chat.getByDayCount": crud.chat.getByDayCountQuery(day),
+        "chat.getByFilter": crud.chat.getByFilterQuery(limit=10),
+        "chat.getByFilter(before)": crud.chat.getByFilterQuery(limit=10, before=(day, 100)),
+        "chat.getByFilter(orgCode, solved=no)": crud.chat.getByFilterQuery(
+            limit=10, orgCode="o", startDate="2024-01-01", solvedFilter="no"),
+        "chat.countByFilter(orgCode, solved=no)": crud.chat.countByFilterQuery(
+            orgCode="o", startDate="2024-01-01", solvedFilter="no"),
+        "message.getByChat": crud.message.getByChatQuery("c"),
+        "survey.getAllN0SurveyCount": crud.survey.getAllN0SurveyCountQuery(),
+        "survey.getByChatId": crud.survey.getByChatIdQuery("c"),
+        "topic.getByTopicName": crud.topic.getByTopicNameQuery("d"),
+        "topic.getHot": crud.topic.getHotQuery(),
+        "topic.getByFilter(after)": crud.topic.getByFilterQuery(after=(1, 100)),
+        "daily_chat_stats.getOrgTotals": crud.daily_chat_stats.getOrgTotalsQuery(),
+        "daily_chat_stats.getDailyCounts": crud.daily_chat_stats.getDailyCountsQuery(day.date()),
+    }
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """执行计划中没有使用索引的全表扫描"""
+    return [detail for detail in plan if detail.startswith("SCAN ") and " USING " not in detail
+            and detail != "SCAN CONSTANT ROW"]
+
+
+def check_query_plans(bind=engine) -> Dict[str, Dict]:
+    """用EXPLAIN QUERY PLAN检查热点查询（仅SQLite），返回每条查询的执行计划和全表扫描"""
+    results = {}
+    with bind.connect() as conn:
+        if conn.dialect.name != "sqlite":
+            raise RuntimeError("执行计划检查仅支持SQLite")
+        for name, stmt in hot_queries().items():
+            compiled = stmt.compile(dialect=conn.dialect)
+            params = tuple(str(value) if isinstance(value, (date, datetime)) else value
+                           for value in (compiled.params[key] for key in compiled.positiontup))
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, params)]
+            results[name] = {"plan": plan, "full_scans": full_scans(plan)}
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        Base.metadata.create_all(bind=engine)
+        print(upgrade() or "没有需要执行的迁移")
+    elif command == "status":
+        for item in status():
+            print(item)
+    elif command == "check":
+        failed = False
+        for name, result in check_query_plans().items():
+            print(("全表扫描 " if result["full_scans"] else "OK ") + name)
+            for detail in result["plan"]:
+                print(f"    {detail}")
+            failed = failed or bool(result["full_scans"])
+        sys.exit(1 if failed else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
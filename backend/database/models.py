@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -50,6 +50,13 @@ class Chat(Base):
     session = relationship("Session", back_populates="chats")
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 会话下的最近对话、按机构筛选后按时间倒序
+        Index("ix_chats_sessionId_createdAt", "sessionId", "createdAt"),
+        # 按日统计、按日期筛选、对话列表按(createdAt, id)倒序键集分页
+        Index("ix_chats_createdAt_id", "createdAt", "id"),
+    )
+
     # 关系：一个对话有一个调查
     survey = relationship("Survey", back_populates="chat", uselist=False)
 
@@ -69,6 +76,11 @@ class Message(Base):
     # 关系：一条消息属于一个对话
     chat = relationship("Chat", back_populates="messages")
 
+    __table_args__ = (
+        # 按对话读取消息并按发送顺序排列
+        Index("ix_messages_chatId_id", "chatId", "id"),
+    )
+
 
 class Topic(Base):
     __tablename__ = "topics"
@@ -86,6 +98,13 @@ class Topic(Base):
     createdAt = Column(DateTime, default=datetime.now)
     isDeleted = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # 按问题描述查找未删除的话题
+        Index("ix_topics_description_isDeleted", "description", "isDeleted"),
+        # 未删除话题按排序字段取热门话题、题库列表按(order, id)键集分页
+        Index("ix_topics_isDeleted_order_id", "isDeleted", "order", "id"),
+    )
+
     def __getitem__(self, item):
         return getattr(self, item)
 
@@ -108,6 +127,13 @@ class Survey(Base):
     # 关系：一个调查属于一个对话
     chat = relationship("Chat", back_populates="survey")
 
+    __table_args__ = (
+        # 满意度筛选的exists()子查询、按对话取调查
+        Index("ix_surveys_chatId_solved", "chatId", "solved"),
+        # 统计未解决的调查数
+        Index("ix_surveys_solved", "solved"),
+    )
+
 class Contact(Base):
     __tablename__ = "contacts"
 
@@ -117,3 +143,20 @@ class Contact(Base):
     order = Column(Integer, nullable=False)
     createdAt = Column(DateTime, default=datetime.now)
 
+
+class DailyChatStats(Base):
+    """按天、按机构预聚合的对话数和未解决调查数，供管理后台首页使用
+
+    对话和调查写入时增量更新，后台定时任务按原始表重新统计校正。
+    """
+    __tablename__ = "daily_chat_stats"
+
+    day = Column(Date, primary_key=True)
+    orgCode = Column(String, primary_key=True)
+    chats = Column(Integer, nullable=False, default=0)
+    unsolved = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # 按机构汇总时只读索引
+        Index("ix_daily_chat_stats_orgCode", "orgCode", "chats", "unsolved"),
+    )
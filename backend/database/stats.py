@@ -0,0 +1,175 @@
+"""对话日统计（daily_chat_stats）的校正
+
+对话和调查写入时只做增量更新，写入失败或在统计上线前产生的数据会有偏差。
+这里按原始表重新统计，与统计表比较后只修正有偏差的行，启动迁移时执行一次，
+之后由后台线程定时执行。
+
+对话按创建日期、所属机构统计；未解决调查按调查的提交日期、对话所属机构统计，
+与写入时的增量更新（crud.daily_chat_stats.recordSurvey）一致。
+"""
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Date, cast, delete, func, insert, select, type_coerce, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from .config import engine
+from .models import Chat, DailyChatStats, Session, Survey
+
+
+def day_of(column, dialect_name: str):
+    """取日期时间列的日期部分"""
+    if dialect_name == "sqlite":
+        return type_coerce(func.date(column), Date)
+    return cast(func.trunc(column), Date)
+
+
+def as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def count_daily_stats(conn) -> Dict[Tuple[date, str], list]:
+    """按原始表统计每天每个机构的对话数和未解决调查数"""
+    name = conn.dialect.name
+    chat_day = day_of(Chat.createdAt, name)
+    survey_day = day_of(Survey.createdAt, name)
+    counts: Dict[Tuple[date, str], list] = {}
+    rows = conn.execute(select(chat_day, Session.orgCode, func.count(Chat.id))
+                        .join(Session, Session.sessionId == Chat.sessionId)
+                        .group_by(chat_day, Session.orgCode))
+    for day, org_code, chats in rows:
+        counts.setdefault((as_date(day), org_code), [0, 0])[0] = chats
+    rows = conn.execute(select(survey_day, Session.orgCode, func.count(Survey.id))
+                        .join(Chat, Chat.chatId == Survey.chatId)
+                        .join(Session, Session.sessionId == Chat.sessionId)
+                        .where(Survey.solved == "no")
+                        .group_by(survey_day, Session.orgCode))
+    for day, org_code, unsolved in rows:
+        counts.setdefault((as_date(day), org_code), [0, 0])[1] = unsolved
+    return counts
+
+
+def find_drift(conn) -> Dict[date, Dict[str, Tuple[int, int]]]:
+    """在同一个事务中统计原始表和读取统计表，返回 {日期: {机构: (对话数差值, 未解决数差值)}}"""
+    expected = count_daily_stats(conn)
+    current = {(as_date(day), org_code): [chats, unsolved] for day, org_code, chats, unsolved in conn.execute(
+        select(DailyChatStats.day, DailyChatStats.orgCode, DailyChatStats.chats, DailyChatStats.unsolved))}
+    drift: Dict[date, Dict[str, Tuple[int, int]]] = {}
+    for key in expected.keys() | current.keys():
+        (chats, unsolved), (old_chats, old_unsolved) = expected.get(key, (0, 0)), current.get(key, (0, 0))
+        if (chats, unsolved) != (old_chats, old_unsolved):
+            day, org_code = key
+            drift.setdefault(day, {})[org_code] = (chats - old_chats, unsolved - old_unsolved)
+    return drift
+
+
+def add_counts(conn, day: date, org_code: str, chats: int, unsolved: int):
+    """累加某天某机构的计数，行不存在时插入，与写入时的增量更新使用同样的原子累加"""
+    if conn.dialect.name == "sqlite":
+        stmt = sqlite_insert(DailyChatStats).values(day=day, orgCode=org_code, chats=chats, unsolved=unsolved)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyChatStats.day, DailyChatStats.orgCode],
+            set_={"chats": DailyChatStats.chats + chats, "unsolved": DailyChatStats.unsolved + unsolved},
+        ))
+        return
+    result = conn.execute(update(DailyChatStats).where(DailyChatStats.day == day, DailyChatStats.orgCode == org_code)
+                          .values(chats=DailyChatStats.chats + chats, unsolved=DailyChatStats.unsolved + unsolved))
+    if not result.rowcount:
+        conn.execute(insert(DailyChatStats).values(day=day, orgCode=org_code, chats=chats, unsolved=unsolved))
+
+
+def apply_drift(conn, day: date, deltas: Dict[str, Tuple[int, int]]):
+    """把一天的差值累加到统计表，清掉累加后为0的行"""
+    for org_code, (chats, unsolved) in deltas.items():
+        add_counts(conn, day, org_code, chats, unsolved)
+    conn.execute(delete(DailyChatStats).where(
+        DailyChatStats.day == day, DailyChatStats.chats == 0, DailyChatStats.unsolved == 0))
+
+
+def reconcile(conn) -> int:
+    """在当前事务中校正统计表（启动迁移使用），返回有偏差的行数"""
+    drift = find_drift(conn)
+    for day, deltas in drift.items():
+        apply_drift(conn, day, deltas)
+    return sum(len(deltas) for deltas in drift.values())
+
+
+def reconcile_by_day(bind=engine) -> int:
+    """校正统计表，返回有偏差的行数
+
+    先在一个只读事务中算出统计表与原始表的差值，再按天各用一个短事务把差值原子累加上去，
+    不整表删除重写：统计之后并发写入的对话和调查同时计入原始表和统计表，差值不受影响，
+    不会丢失并发的增量更新。写事务第一条语句就是写入，SQLite WAL下也不会因为读快照
+    过期而失败（BUSY_SNAPSHOT）。
+    """
+    with bind.connect() as conn:
+        with conn.begin():
+            drift = find_drift(conn)
+    for day, deltas in sorted(drift.items()):
+        with bind.begin() as conn:
+            apply_drift(conn, day, deltas)
+    return sum(len(deltas) for deltas in drift.values())
+
+
+class DailyStatsReconciler:
+    """定时校正对话日统计的后台线程"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_run_at: Optional[float] = None
+        self.last_drift = 0
+        self.runs = 0
+        self.errors = 0
+
+    def run(self) -> int:
+        start = time.perf_counter()
+        try:
+            drift = reconcile_by_day()
+        except Exception as e:
+            print(f"校正对话日统计出错: {str(e)}")
+            self.errors += 1
+            return 0
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_drift = drift
+        if drift:
+            print(f"对话日统计校正了 {drift} 行，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        return drift
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.run()
+
+    def start(self):
+        """启动后台校正线程，interval不大于0时不启动"""
+        if self._thread is None and self.interval > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="daily-stats-reconcile", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_drift": self.last_drift,
+        }
+
+
+daily_stats_reconciler = DailyStatsReconciler(settings.DASHBOARD_STATS_RECONCILE_INTERVAL)
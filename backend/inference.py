@@ -0,0 +1,541 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database.crud import message as message_crud
+
+
+class InferenceBusyError(RuntimeError):
+    """推理队列已满"""
+
+
+class TokenBudget:
+    """提示和生成的token预算
+
+    提示超过max_prompt_tokens时保留开头的system消息，其余消息按轮（一条用户消息
+    及其后的回复）从最早的一轮开始整轮丢弃，一次裁到 max_prompt_tokens * trim_ratio 以下，
+    留出余量让之后几轮仍能复用前缀缓存。只剩最后一轮仍然超长时截掉最后一条消息内容的开头，
+    裁剪后总是按对话模板重新渲染，系统提示和模板本身不会被截断。
+    """
+
+    def __init__(self, max_prompt_tokens: int, max_new_tokens: int, timeout: float, trim_ratio: float = 0.75):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_new_tokens = max_new_tokens
+        self.timeout = timeout
+        self.trim_ratio = trim_ratio
+
+    def trim(self, chatbot, messages: List[Dict[str, str]]):
+        """裁剪过长的对话，返回（保留的消息，提示token ID）"""
+        target = int(self.max_prompt_tokens * self.trim_ratio)
+        head = 0
+        while head < len(messages) and messages[head]["role"] == "system":
+            head += 1
+        system, rest = messages[:head], messages[head:]
+        # 每一轮开始的位置，开头不是用户消息时（如欢迎语）也算作一轮
+        starts = [i for i, message in enumerate(rest) if message["role"] == "user" and i > 0]
+        for start in [0] + starts:
+            kept = system + rest[start:]
+            ids = chatbot.encode(chatbot.render(kept))
+            if len(ids) <= target:
+                break
+        if len(ids) > self.max_prompt_tokens and len(kept) > head:
+            kept, ids = self._shorten_last(chatbot, kept)
+        return kept, ids
+
+    def _shorten_last(self, chatbot, messages: List[Dict[str, str]]):
+        """只保留最后一条消息内容的末尾，使渲染后的提示不超过max_prompt_tokens"""
+        last = messages[-1]
+        content_ids = chatbot.encode(last["content"])
+        overhead = len(chatbot.encode(chatbot.render(messages[:-1] + [{**last, "content": ""}])))
+        keep = self.max_prompt_tokens - overhead
+        while True:
+            # 从token中间截开时开头可能是半个字符
+            content = chatbot.tokenizer.decode(content_ids[-keep:]).lstrip("\ufffd") if keep > 0 else ""
+            kept = messages[:-1] + [{**last, "content": content}]
+            ids = chatbot.encode(chatbot.render(kept))
+            if len(ids) <= self.max_prompt_tokens or keep <= 0:
+                return kept, ids
+            keep -= len(ids) - self.max_prompt_tokens
+
+
+token_budget = TokenBudget(
+    settings.LLM_MAX_PROMPT_TOKENS,
+    settings.LLM_MAX_NEW_TOKENS,
+    settings.LLM_GENERATION_TIMEOUT,
+)
+
+
+class Conversation:
+    """一个对话的上下文：消息列表和已编码提示的缓存"""
+
+    def __init__(self, chat_id: str, messages: List[Dict[str, str]]):
+        self.chat_id = chat_id
+        self.messages = messages
+        # 上一轮提示的文本和token ID，下一轮只需编码新增部分
+        self.prompt_text = ""
+        self.prompt_ids = []
+        # 计入ConversationStore预算的token数，只在store的锁内读写
+        self.counted_tokens = 0
+        # 调用方上次通过sync传来的完整消息
+        self.synced = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """按chatId保存的对话上下文
+
+    首次使用时从Message表加载历史消息，之后由消息的保存接口追加。
+    缓存的token ID总数超过预算时按最近最少使用淘汰，空闲过久的对话也会被淘汰，
+    淘汰后再次使用时重新从数据库加载。
+    """
+
+    def __init__(self, max_tokens: int, idle_seconds: float):
+        self.max_tokens = max_tokens
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._conversations = OrderedDict()
+        self._tokens = 0
+        self.stats = {"loads": 0, "evictions": 0, "reused_tokens": 0, "encoded_tokens": 0, "trimmed": 0}
+
+    async def get(self, db: AsyncSession, chat_id: str) -> Conversation:
+        """获取对话上下文，不在内存中时从数据库加载"""
+        with self._lock:
+            conversation = self._conversations.get(chat_id)
+            if conversation is not None:
+                self._conversations.move_to_end(chat_id)
+                conversation.last_used = time.monotonic()
+                return conversation
+        messages = [
+            {"role": msg.sender, "content": msg.content}
+            for msg in await message_crud.getByChat(db, chat_id)
+        ]
+        with self._lock:
+            # 加载期间其他请求可能已经放入
+            conversation = self._conversations.get(chat_id)
+            if conversation is None:
+                conversation = self._conversations[chat_id] = Conversation(chat_id, messages)
+                self.stats["loads"] += 1
+            self._evict()
+            return conversation
+
+    def sync(self, chat_id: str, messages: List[Dict[str, str]]) -> Conversation:
+        """用调用方传来的完整消息更新对话（推理进程使用）
+
+        与上次传来的消息比较共同前缀：只在末尾追加了新消息时接到已有的上下文之后
+        （上下文可能已被裁剪），编码缓存继续有效；之前的消息有变化时按新消息重建。
+        """
+        with self._lock:
+            conversation = self._conversations.get(chat_id)
+            if conversation is None:
+                conversation = self._conversations[chat_id] = Conversation(chat_id, [])
+                self.stats["loads"] += 1
+            self._conversations.move_to_end(chat_id)
+            conversation.last_used = time.monotonic()
+            self._evict()
+        with conversation.lock:
+            synced = conversation.synced
+            shared = 0
+            while shared < min(len(synced), len(messages)) and synced[shared] == messages[shared]:
+                shared += 1
+            if shared == len(synced):
+                conversation.messages.extend(messages[shared:])
+            else:
+                conversation.messages = list(messages)
+                conversation.prompt_text = ""
+                conversation.prompt_ids = []
+            conversation.synced = list(messages)
+        return conversation
+
+    def append(self, chat_id: str, role: str, content: str):
+        """消息保存后追加到已加载的对话中，未加载的对话下次使用时从数据库读取"""
+        with self._lock:
+            conversation = self._conversations.get(chat_id)
+        if conversation is not None:
+            with conversation.lock:
+                conversation.messages.append({"role": role, "content": content})
+
+    def encode(self, chatbot, conversation: Conversation) -> List[int]:
+        """编码对话的提示，复用上一轮未变化的前缀"""
+        with conversation.lock:
+            text = chatbot.render(conversation.messages)
+            reused = len(conversation.prompt_ids) if text.startswith(conversation.prompt_text) else 0
+            ids = chatbot.encode(text, conversation.prompt_text, conversation.prompt_ids)
+            trimmed = len(ids) > token_budget.max_prompt_tokens
+            if trimmed:
+                # 裁掉的旧消息同时从内存中的上下文移除，前缀缓存随之重建
+                conversation.messages, ids = token_budget.trim(chatbot, conversation.messages)
+                text = chatbot.render(conversation.messages)
+                reused = 0
+            conversation.prompt_text = text
+            conversation.prompt_ids = ids
+        with self._lock:
+            # 已被淘汰的对话不再计入预算；计入的数量与淘汰时扣除的数量都在这把锁内读写
+            if self._conversations.get(conversation.chat_id) is conversation:
+                self._tokens += len(ids) - conversation.counted_tokens
+                conversation.counted_tokens = len(ids)
+            self.stats["reused_tokens"] += reused
+            self.stats["encoded_tokens"] += len(ids) - reused
+            self.stats["trimmed"] += trimmed
+            self._evict()
+        return ids
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._conversations:
+            chat_id, conversation = next(iter(self._conversations.items()))
+            if self._tokens <= self.max_tokens and now - conversation.last_used <= self.idle_seconds:
+                break
+            del self._conversations[chat_id]
+            self._tokens -= conversation.counted_tokens
+            conversation.counted_tokens = 0
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取上下文缓存统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["conversations"] = len(self._conversations)
+            stats["cached_tokens"] = self._tokens
+            stats["max_tokens"] = self.max_tokens
+        return stats
+
+
+# 进程内共享的对话上下文
+conversation_store = ConversationStore(settings.LLM_CONTEXT_CACHE_TOKENS, settings.LLM_CONTEXT_IDLE_SECONDS)
+
+
+class GenerationStream:
+    """流式生成：async for 逐段取得新生成的文本，迭代结束后result为与generate相同的结果
+
+    生成在推理线程中进行，每段文本通过call_soon_threadsafe放入队列；结果在所有文本
+    之后才写回future，所以结束标记一定排在最后一段文本之后。迭代中途退出（如客户端断开）
+    时取消等待，尚未开始生成的请求不再生成。
+    """
+
+    def __init__(self, submit: Callable[[Callable[[str], None]], Any]):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(submit(self._queue.put_nowait))
+        self._task.add_done_callback(lambda _: self._queue.put_nowait(None))
+        self.result = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                delta = await self._queue.get()
+                if delta is None:
+                    break
+                yield delta
+            self.result = self._task.result()
+        finally:
+            if not self._task.done():
+                self._task.cancel()
+
+
+class InferenceService:
+    """大模型推理服务
+
+    model.generate 是同步且耗时的调用，直接放在 async 路由里会卡住整个事件循环。
+    这里由一个专用线程执行推理：路由把对话放进有界队列后 await 一个
+    asyncio future；推理线程取出第一条请求后，在很短的等待窗口内继续收集请求，
+    凑成一批填充后调用一次 generate，再把结果写回各自的 future。
+    队列满时直接拒绝新请求，由路由返回503，避免请求无限堆积。
+
+    配置了sidecar_url时不在本进程加载模型，而是把请求转发给独立的推理进程
+    （见 inference_server.py），多个uvicorn worker共用同一份模型权重。
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", max_batch_size: int = 4,
+                 batch_wait_ms: float = 20, queue_size: int = 32, sidecar_url: Optional[str] = None):
+        self.model_name = model_name
+        self.backend = backend
+        self.sidecar_url = sidecar_url.rstrip("/") if sidecar_url else None
+        self._remote = False
+        self.load_stats = {}
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self.chatbot = None
+        self.stats = {
+            "requests": 0, "rejected": 0, "batches": 0, "batched_requests": 0, "errors": 0, "timeouts": 0,
+            "prompt_tokens": 0, "generated_tokens": 0, "max_prompt_tokens": 0, "max_generated_tokens": 0,
+        }
+        # 统计在事件循环和推理线程中都会更新
+        self._stats_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None or self._remote
+
+    def start(self) -> Dict[str, Any]:
+        """加载模型并启动推理线程，返回各阶段耗时（毫秒）"""
+        if self.running:
+            return self.load_stats
+        if self.sidecar_url:
+            self._remote = True
+            self.load_stats = {"sidecar": self.sidecar_url}
+            return self.load_stats
+        # 导入在这里，未启用大模型时不加载transformers和torch
+        start = time.perf_counter()
+        import torch
+        from chat import QwenChatbot
+        if settings.LLM_NUM_THREADS:
+            torch.set_num_threads(settings.LLM_NUM_THREADS)
+        import_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        self.chatbot = QwenChatbot(self.model_name, self.backend)
+        self.load_stats = {
+            "backend": self.backend,
+            "import_ms": import_ms,
+            "load_ms": (time.perf_counter() - start) * 1000,
+        }
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+        return self.load_stats
+
+    def stop(self):
+        """停止推理线程，未处理的请求以异常结束"""
+        self._remote = False
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        while True:
+            try:
+                _, future, loop, _, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            loop.call_soon_threadsafe(self._set_exception, future, RuntimeError("推理服务已停止"))
+
+    async def generate(self, messages: List[Dict[str, str]], max_new_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """提交一段不保存上下文的对话，等待生成结果"""
+        return await self._submit(messages, max_new_tokens)
+
+    async def chat(self, conversation: Conversation, max_new_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """为已保存上下文的对话（最后一条为用户消息）生成回复"""
+        return await self._submit(conversation, max_new_tokens)
+
+    def stream(self, request, max_new_tokens: Optional[int] = None) -> GenerationStream:
+        """与generate/chat相同，但边生成边产出文本，request为消息列表或Conversation"""
+        return GenerationStream(lambda on_delta: self._submit(request, max_new_tokens, on_delta))
+
+    async def _submit(self, request, max_new_tokens: Optional[int],
+                      on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """排队等待生成
+
+        返回 {"text", "prompt_tokens", "generated_tokens", "elapsed_ms"}。
+        生成数不超过预算的上限；超过截止时间仍在排队的请求以TimeoutError结束，
+        已开始的生成到截止时间停止并返回已生成的部分。
+        传入on_delta时，每生成一段文本就在事件循环中调用一次。
+        """
+        if self._remote:
+            return await self._submit_remote(request, max_new_tokens, on_delta)
+        if self._thread is None:
+            raise RuntimeError("推理服务未启动")
+        max_new_tokens = min(max_new_tokens or token_budget.max_new_tokens, token_budget.max_new_tokens)
+        deadline = time.monotonic() + token_budget.timeout
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((request, future, loop, deadline, max_new_tokens, on_delta))
+        except queue.Full:
+            self._count("rejected")
+            raise InferenceBusyError("推理队列已满，请稍后再试")
+        self._count("requests")
+        return await future
+
+    async def _submit_remote(self, request, max_new_tokens: Optional[int],
+                             on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """转发给推理进程，对话上下文随请求一起发送；流式请求逐行读取推理进程返回的文本"""
+        payload = {"maxNewTokens": max_new_tokens, "stream": on_delta is not None}
+        if isinstance(request, Conversation):
+            with request.lock:
+                payload["messages"] = list(request.messages)
+            payload["chatId"] = request.chat_id
+        else:
+            payload["messages"] = request
+        self._count("requests")
+        loop = asyncio.get_running_loop()
+        emit = (lambda delta: loop.call_soon_threadsafe(on_delta, delta)) if on_delta else None
+        try:
+            result = await asyncio.to_thread(self._post, "/generate", payload, emit)
+        except urllib.error.HTTPError as e:
+            if e.code == 503:
+                self._count("rejected")
+                raise InferenceBusyError("推理队列已满，请稍后再试")
+            if e.code == 504:
+                self._count("timeouts")
+                raise TimeoutError("推理排队超时")
+            self._count("errors")
+            raise RuntimeError(f"推理进程返回错误: {e.code}")
+        except urllib.error.URLError as e:
+            self._count("errors")
+            raise RuntimeError(f"无法连接推理进程: {e.reason}")
+        self._record(result["prompt_tokens"], result["generated_tokens"])
+        return result
+
+    def _post(self, path: str, payload: Dict[str, Any], emit: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        request = urllib.request.Request(
+            self.sidecar_url + path,
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        # 推理进程自己按截止时间结束生成，这里多留一些余量
+        with urllib.request.urlopen(request, timeout=token_budget.timeout + 10) as response:
+            if emit is None:
+                return json.loads(response.read())
+            # 流式响应每行一个JSON：{"delta"}、最后是{"result"}，出错时为{"error": 状态码}
+            for line in response:
+                item = json.loads(line)
+                if "delta" in item:
+                    emit(item["delta"])
+                elif "result" in item:
+                    return item["result"]
+                elif "error" in item:
+                    raise urllib.error.HTTPError(request.full_url, item["error"], item.get("detail", ""), None, None)
+            raise urllib.error.URLError("推理进程提前结束了响应")
+
+    def _collect_batch(self) -> List[Any]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # 调用方已取消（如客户端断开）或已超过截止时间的请求不再生成
+        now = time.monotonic()
+        pending = []
+        for item in batch:
+            _, future, loop, deadline, _, _ = item
+            if future.cancelled():
+                continue
+            if deadline <= now:
+                self._count("timeouts")
+                loop.call_soon_threadsafe(self._set_exception, future, TimeoutError("推理排队超时"))
+                continue
+            pending.append(item)
+        return pending
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                prompts = [self._encode(request) for request, _, _, _, _, _ in batch]
+                # 同一批按最大的生成上限和最晚的截止时间生成，再按各自上限截断
+                replies = self.chatbot.generate_batch(
+                    prompts,
+                    max_new_tokens=max(item[4] for item in batch),
+                    max_time=max(item[3] for item in batch) - time.monotonic(),
+                    streamer=self._streamer(batch)
+                )
+            except Exception as e:
+                print(f"推理出错: {str(e)}")
+                self._count("errors")
+                for _, future, loop, _, _, _ in batch:
+                    loop.call_soon_threadsafe(self._set_exception, future, e)
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._count("batches")
+            self._count("batched_requests", len(batch))
+            for (_, future, loop, _, max_new_tokens, _), prompt, (text, generated) in zip(batch, prompts, replies):
+                if generated > max_new_tokens:
+                    text = self.chatbot.tokenizer.decode(self.chatbot.tokenizer(text, add_special_tokens=False).input_ids[:max_new_tokens])
+                    generated = max_new_tokens
+                self._record(len(prompt), generated)
+                loop.call_soon_threadsafe(self._set_result, future, {
+                    "text": text,
+                    "prompt_tokens": len(prompt),
+                    "generated_tokens": generated,
+                    "elapsed_ms": elapsed_ms,
+                })
+
+    def _streamer(self, batch):
+        """批中有流式请求时创建streamer，把各行的新文本交回各自的事件循环"""
+        if all(item[5] is None for item in batch):
+            return None
+        from chat import TokenStreamer
+        callbacks = [
+            (lambda delta, loop=loop, on_delta=on_delta: loop.call_soon_threadsafe(on_delta, delta)) if on_delta else None
+            for _, _, loop, _, _, on_delta in batch
+        ]
+        return TokenStreamer(self.chatbot.tokenizer, callbacks, [item[4] for item in batch])
+
+    def _encode(self, request) -> List[int]:
+        if isinstance(request, Conversation):
+            return conversation_store.encode(self.chatbot, request)
+        ids = self.chatbot.encode(self.chatbot.render(request))
+        if len(ids) > token_budget.max_prompt_tokens:
+            _, ids = token_budget.trim(self.chatbot, request)
+        return ids
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _record(self, prompt_tokens: int, generated_tokens: int):
+        with self._stats_lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["generated_tokens"] += generated_tokens
+            self.stats["max_prompt_tokens"] = max(self.stats["max_prompt_tokens"], prompt_tokens)
+            self.stats["max_generated_tokens"] = max(self.stats["max_generated_tokens"], generated_tokens)
+
+    @staticmethod
+    def _set_result(future: asyncio.Future, result: Any):
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, exc: BaseException):
+        if not future.done():
+            future.set_exception(exc)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取推理统计"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["batched_requests"] / stats["batches"] if stats["batches"] else 0.0
+        completed = stats["batched_requests"]
+        stats["avg_prompt_tokens"] = stats["prompt_tokens"] / completed if completed else 0.0
+        stats["avg_generated_tokens"] = stats["generated_tokens"] / completed if completed else 0.0
+        stats["running"] = self.running
+        stats["backend"] = self.backend
+        stats["load"] = self.load_stats
+        stats["context"] = conversation_store.get_stats()
+        return stats
+
+
+# 进程内共享的推理服务，LLM_ENABLED 时在应用启动时启动
+inference_service = InferenceService(
+    settings.LLM_MODEL_PATH,
+    backend=settings.LLM_BACKEND,
+    max_batch_size=settings.LLM_MAX_BATCH_SIZE,
+    batch_wait_ms=settings.LLM_BATCH_WAIT_MS,
+    queue_size=settings.LLM_QUEUE_SIZE,
+    sidecar_url=settings.LLM_SIDECAR_URL,
+)
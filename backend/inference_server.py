@@ -0,0 +1,72 @@
+"""独立的大模型推理进程
+
+模型只在这个进程中加载一次，各uvicorn worker配置 LLM_SIDECAR_URL 后把请求转发过来，
+worker数量增加时不会多占一份模型内存。只应监听本机地址：
+
+    uvicorn inference_server:app --host 127.0.0.1 --port 8001
+"""
+import json
+import time
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+
+from inference import inference_service, conversation_store, InferenceBusyError
+
+app = FastAPI()
+
+
+@app.on_event("startup")
+async def startup_event():
+    # 本进程自己加载模型，不再转发
+    inference_service.sidecar_url = None
+    start = time.perf_counter()
+    load_stats = inference_service.start()
+    print(f"推理进程启动完成: {load_stats}，总耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    inference_service.stop()
+
+
+def _json_line(item: dict) -> str:
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+async def generate_stream(request, max_new_tokens):
+    """流式生成：每行一个JSON，先是各段{"delta"}，最后是{"result"}；出错时为{"error": 状态码}"""
+    stream = inference_service.stream(request, max_new_tokens)
+    try:
+        async for delta in stream:
+            yield _json_line({"delta": delta})
+        yield _json_line({"result": stream.result})
+    except InferenceBusyError as e:
+        yield _json_line({"error": 503, "detail": str(e)})
+    except TimeoutError as e:
+        yield _json_line({"error": 504, "detail": str(e)})
+    except Exception as e:
+        yield _json_line({"error": 500, "detail": str(e)})
+
+
+@app.post("/generate")
+async def generate(data: dict):
+    """生成回复：带chatId时按对话缓存编码结果，否则为无状态请求；stream为真时逐段返回"""
+    messages = data.get("messages") or []
+    max_new_tokens = data.get("maxNewTokens")
+    request = conversation_store.sync(data["chatId"], messages) if data.get("chatId") else messages
+    if data.get("stream"):
+        return StreamingResponse(generate_stream(request, max_new_tokens), media_type="application/x-ndjson")
+    try:
+        if data.get("chatId"):
+            return await inference_service.chat(request, max_new_tokens)
+        return await inference_service.generate(request, max_new_tokens)
+    except InferenceBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+@app.get("/stats")
+async def get_stats():
+    """获取推理统计"""
+    return inference_service.get_stats()
@@ -1,24 +1,76 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from admin_api import router as admin_router
 from api_v1.base import router as base_router
-from database.config import get_db, init_db
+from database.config import session_scope, init_db, async_engine
 from database.init_data import init_all_data
 from api_v1.auth import router as auth_router
 from api_v1.survey import router as survey_router
 from api_v1.chat import router as chat_router
+from search import close_search_index, start_index_updates, warm_up_search
+from inference import inference_service
+from database.stats import daily_stats_reconciler
+from config import settings
 
 app = FastAPI()
+# 预热完成前不对外报告就绪
+app.state.ready = False
+app.state.warmup = {}
+# 启动各阶段耗时（毫秒）
+app.state.startup = {}
 
 # 初始化数据库
 init_db()
 
-# 启动事件：初始化数据
+# 启动事件：初始化数据并预热搜索
 @app.on_event("startup")
 async def startup_event():
-    db = next(get_db())
-    init_all_data(db)
+    startup = app.state.startup
+    begin = time.perf_counter()
+    with session_scope() as db:
+        init_all_data(db)
+        startup["init_data_ms"] = (time.perf_counter() - begin) * 1000
+        start = time.perf_counter()
+        app.state.warmup = warm_up_search(db)
+    start_index_updates()
+    daily_stats_reconciler.start()
+    startup["search_ms"] = (time.perf_counter() - start) * 1000
+    if settings.LLM_ENABLED:
+        start = time.perf_counter()
+        startup["llm"] = inference_service.start()
+        startup["llm_ms"] = (time.perf_counter() - start) * 1000
+    startup["total_ms"] = (time.perf_counter() - begin) * 1000
+    app.state.ready = True
+    print(f"搜索预热完成: {app.state.warmup}")
+    print(f"启动耗时: {startup}")
+
+# 就绪检查：预热完成前返回503，负载均衡不会把流量转到冷启动的worker
+@app.get("/api/ready")
+async def ready():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "warmup": app.state.warmup, "startup": app.state.startup}
+
+# 停止事件：关闭共享的搜索索引
+@app.on_event("shutdown")
+async def shutdown_event():
+    inference_service.stop()
+    daily_stats_reconciler.stop()
+    close_search_index()
+    await async_engine.dispose()
+
+# 记录每个请求的处理耗时
+@app.middleware("http")
+async def add_process_time_header(request: Request, call_next):
+    start = time.perf_counter()
+    # 流式回复据此计算首字节耗时
+    request.state.received_at = start
+    response = await call_next(request)
+    response.headers["X-Process-Time"] = f"{(time.perf_counter() - start) * 1000:.2f}ms"
+    return response
 
 # Configure CORS
 app.add_middleware(
@@ -27,6 +79,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端从响应头读取题库总数和下一页游标
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 # 注册管理API路由
@@ -0,0 +1,115 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from cache import TTLCache, normalize_question
+from config import settings
+from inference import inference_service
+from search import index_manager
+
+
+RAG_SYSTEM_PROMPT = (
+    "你是银行业务咨询助手。请只根据下面的参考资料回答用户的问题，回答要简洁；"
+    "参考资料中没有相关内容时，请回答“抱歉，暂时没有找到相关业务说明，建议咨询人工客服。”"
+)
+
+
+def build_prompt(question: str, topics: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """用检索到的话题拼出紧凑的提示，每条话题只保留描述和截断后的答案"""
+    max_chars = settings.RAG_TOPIC_MAX_CHARS
+    references = []
+    for i, topic in enumerate(topics, 1):
+        answer = topic["operator"] or ""
+        if len(answer) > max_chars:
+            answer = answer[:max_chars] + "…"
+        references.append(f"[{i}] 问题：{topic['description']}\n答案：{answer}")
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        {"role": "user", "content": "参考资料：\n" + "\n\n".join(references) + f"\n\n用户问题：{question}"},
+    ]
+
+
+class RagAnswerer:
+    """检索增强的大模型回答
+
+    Whoosh原始分（bm25_score）最高的话题达到阈值时直接返回题库答案；否则把前k条话题拼成提示交给大模型。
+    模型的回答按（问题, 话题集合）缓存，索引提交时失效，同一问题同时到达时只生成一次。
+    """
+
+    def __init__(self, threshold: float, top_k: int, cache: TTLCache):
+        self.threshold = threshold
+        self.top_k = top_k
+        self.cache = cache
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self.stats = {"direct": 0, "generated": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RAG_ENABLED and inference_service.running
+
+    def pick(self, topics: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Whoosh原始分最高的话题达到阈值时返回它
+
+        启用向量检索时结果按融合分排序，排第一的不一定是Whoosh分最高的，
+        融合分也与阈值不在同一尺度，所以这里按bm25_score挑选。
+        """
+        best = max(topics, key=lambda topic: topic["bm25_score"], default=None)
+        if best is not None and best["bm25_score"] >= self.threshold:
+            self.stats["direct"] += 1
+            return best
+        return None
+
+    async def answer(self, question: str, topics: List[Dict[str, Any]]) -> Optional[str]:
+        """根据前k条话题生成回答，模型不可用或出错时返回None"""
+        parts = [delta async for delta in self.stream(question, topics)]
+        return "".join(parts).strip() or None
+
+    async def stream(self, question: str, topics: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """与answer相同，但边生成边产出文本；命中缓存或等待同一问题时一次产出全部文本
+
+        模型不可用或出错时不产出任何文本。
+        """
+        topics = topics[:self.top_k]
+        key = (normalize_question(question), tuple(topic["topicId"] for topic in topics))
+        text = self.cache.get(key)
+        pending = self._pending.get(key) if text is None else None
+        if pending is not None:
+            text = await asyncio.shield(pending)
+        if text is not None or pending is not None:
+            if text is not None:
+                yield text
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        version = self.cache.version
+        text = None
+        try:
+            parts = []
+            async for delta in inference_service.stream(build_prompt(question, topics), settings.RAG_MAX_NEW_TOKENS):
+                # 去掉回答开头的空白，与缓存的文本一致
+                if not parts:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                parts.append(delta)
+                yield delta
+            text = "".join(parts).strip() or None
+            if text is not None:
+                self.cache.set(key, text, version)
+            self.stats["generated"] += 1
+        except Exception as e:
+            print(f"检索增强回答出错: {str(e)}")
+            self.stats["errors"] += 1
+        finally:
+            del self._pending[key]
+            future.set_result(text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取直接作答、模型生成的次数和缓存命中统计"""
+        return {**self.stats, "enabled": self.enabled, "cache": self.cache.get_stats()}
+
+
+# 模型回答缓存，题库变化（任一进程提交索引）时清空
+rag_cache = TTLCache(settings.RAG_CACHE_SIZE, settings.RAG_CACHE_TTL, index_manager.generation)
+index_manager.add_listener(rag_cache.invalidate)
+rag_answerer = RagAnswerer(settings.RAG_SCORE_THRESHOLD, settings.RAG_TOP_K, rag_cache)
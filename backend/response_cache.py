@@ -0,0 +1,157 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from config import settings
+
+
+class MemoryBackend:
+    """进程内缓存后端，只在当前worker内共享"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    async def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    async def bump(self, namespace: str):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class RedisBackend:
+    """Redis缓存后端，多个worker共享缓存和失效，需要安装redis"""
+
+    def __init__(self, url: str, prefix: str = "response_cache:"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._redis.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def generation(self, namespace: str) -> int:
+        return int(await self._redis.get(f"{self.prefix}generation:{namespace}") or 0)
+
+    async def bump(self, namespace: str):
+        await self._redis.incr(f"{self.prefix}generation:{namespace}")
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """按RFC 7232弱比较判断If-None-Match是否包含etag，*匹配任意实体"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """管理后台接口的短TTL响应缓存
+
+    按命名空间缓存序列化后的JSON响应和ETag，浏览器带If-None-Match且内容未变时返回304。
+    数据变化时调用invalidate(namespace)：命名空间的代数加一，旧代数下的缓存不再命中，
+    使用共享后端时所有worker同时失效。ETag取响应内容的哈希，失效后重新计算的结果
+    与之前相同时浏览器仍会得到304。TTL只用于服务端缓存，响应头使用no-cache，
+    浏览器每次都带ETag回来校验，服务端失效后能立即拿到新数据。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0, "errors": 0}
+
+    async def respond(self, request: Request, namespace: str, ttl: float,
+                      compute: Callable[[], Awaitable[Any]], key: str = "") -> Response:
+        """返回缓存的响应，未命中时调用compute生成并写入缓存"""
+        entry = None
+        try:
+            cache_key = f"{namespace}:{await self.backend.generation(namespace)}:{key}"
+            entry = await self.backend.get(cache_key)
+        except Exception as e:
+            # 共享后端不可用时直接计算，不影响接口
+            print(f"读取响应缓存出错: {str(e)}")
+            self.stats["errors"] += 1
+            cache_key = None
+        if entry is None:
+            self.stats["misses"] += 1
+            body = json.dumps(jsonable_encoder(await compute()), ensure_ascii=False).encode("utf-8")
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            entry = etag.encode("ascii") + b"\n" + body
+            if cache_key is not None:
+                try:
+                    await self.backend.set(cache_key, entry, ttl)
+                except Exception as e:
+                    print(f"写入响应缓存出错: {str(e)}")
+                    self.stats["errors"] += 1
+        else:
+            self.stats["hits"] += 1
+        etag, body = entry.split(b"\n", 1)
+        etag = etag.decode("ascii")
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(etag, request.headers.get("if-none-match", "")):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *namespaces: str):
+        """数据变化后调用，使命名空间下的缓存失效"""
+        for namespace in namespaces:
+            try:
+                await self.backend.bump(namespace)
+                self.stats["invalidations"] += 1
+            except Exception as e:
+                print(f"响应缓存失效出错: {str(e)}")
+                self.stats["errors"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中、304和失效次数"""
+        return {**self.stats, "backend": type(self.backend).__name__, "size": self.backend.size()}
+
+
+def create_backend():
+    if settings.RESPONSE_CACHE_URL:
+        return RedisBackend(settings.RESPONSE_CACHE_URL)
+    return MemoryBackend(settings.RESPONSE_CACHE_SIZE)
+
+
+# 管理后台首页和网点选项的响应缓存
+response_cache = ResponseCache(create_backend())
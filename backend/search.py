@@ -1,29 +1,105 @@
+import multiprocessing
 import os
-from whoosh.index import create_in, open_dir
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from whoosh.index import create_in, open_dir, exists_in
 from whoosh.fields import Schema, TEXT, ID, NUMERIC, KEYWORD
 from whoosh.qparser import QueryParser, MultifieldParser, OrGroup, WildcardPlugin, PrefixPlugin
 from whoosh.analysis import StandardAnalyzer, Analyzer, Token, RegexTokenizer
 from whoosh.query import Term, Or, Prefix, Wildcard
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import jieba
 import re
-from database.config import INDEX_DIR
+from database.config import INDEX_DIR, session_scope
+from config import settings
 
 from database.models import Topic
+from vector_search import vector_index
+
+class SegmentCache:
+    """jieba分词结果的LRU缓存，索引和查询共用
+
+    同一段文本（问题描述、关键词、用户提问）只分词一次，超长文本不缓存，
+    以免操作指引之类的大字段挤占缓存。
+    """
+
+    def __init__(self, maxsize: int = 20000, max_text_len: int = 512):
+        self.maxsize = maxsize
+        self.max_text_len = max_text_len
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cut(self, text: str) -> Tuple[str, ...]:
+        """返回文本的分词结果"""
+        if len(text) > self.max_text_len:
+            return tuple(jieba.cut(text))
+        with self._lock:
+            words = self._cache.get(text)
+            if words is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return words
+            self.misses += 1
+        words = tuple(jieba.cut(text))
+        with self._lock:
+            self._cache[text] = words
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return words
+
+    def clear(self):
+        """清空缓存和计数"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# 进程内共享的分词缓存
+segment_cache = SegmentCache()
 
 # 创建中文分词器
 class ChineseAnalyzer(Analyzer):
-    def __call__(self, text, **kargs):
-        words = jieba.cut(text)
-        token_stream = []
-        position = 0
-        for w in words:
-            # 创建 Token 对象并设置 pos 属性
-            token = Token(text=w, pos=position)
-            token_stream.append(token)
+    """基于jieba的流式分词器，与Whoosh自带分词器一样复用同一个Token对象"""
+
+    def __call__(self, value, positions=False, chars=False, keeporiginal=False,
+                 removestops=True, start_pos=0, start_char=0, mode='', **kwargs):
+        token = Token(positions, chars, removestops=removestops, mode=mode, **kwargs)
+        position = start_pos
+        char = start_char
+        for w in segment_cache.cut(value):
+            token.text = w
+            token.boost = 1.0
+            token.stopped = False
+            if keeporiginal:
+                token.original = w
+            # 与原实现一致，始终设置 pos 属性
+            token.pos = position
+            if chars:
+                token.startchar = char
+                token.endchar = char + len(w)
             position += 1
-        return token_stream
+            char += len(w)
+            yield token
 
 # 定义Schema - 修改trcd和inTrcd为KEYWORD类型以支持前缀搜索
 topic_schema = Schema(
@@ -38,57 +114,428 @@ topic_schema = Schema(
     addition=TEXT(stored=True, analyzer=ChineseAnalyzer()),
 )
 
+class CodeSubstringIndex:
+    """交易码子串索引
+
+    以Whoosh词典中的trcd/in_trcd交易码为来源，为每个段建立“子串 -> 交易码”映射。
+    前导通配符查询每次都要遍历整个词典，这里每个段只遍历一次，之后的子串匹配
+    都是一次字典查找。Whoosh刷新searcher时会重新打开段reader，所以映射按段ID
+    （段写入后不再变化）保存，提交后只有新段需要建立映射；切换searcher时
+    删除已被合并掉的段的映射。
+    """
+
+    FIELDS = ("trcd", "in_trcd")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Dict[str, Dict[str, List[bytes]]]] = {}
+        self.builds = 0
+
+    def _build(self, reader) -> Dict[str, Dict[str, List[bytes]]]:
+        tables = {}
+        for fieldname in self.FIELDS:
+            table = {}
+            if fieldname in reader.indexed_field_names():
+                for btext in reader.lexicon(fieldname):
+                    code = btext.decode("utf-8")
+                    for i in range(len(code)):
+                        for j in range(i + 1, len(code) + 1):
+                            table.setdefault(code[i:j], []).append(btext)
+            tables[fieldname] = table
+        return tables
+
+    def lookup(self, reader, fieldname: str, text: str) -> List[bytes]:
+        """返回该段中包含text的交易码"""
+        if not hasattr(reader, "segment"):
+            # 空索引没有段
+            return []
+        segment_id = reader.segment().segment_id()
+        tables = self._tables.get(segment_id)
+        if tables is None:
+            # 在锁外建立映射，不阻塞其他段的查找；并发建立同一个段时保留先完成的
+            tables = self._build(reader)
+            with self._lock:
+                if segment_id not in self._tables:
+                    self.builds += 1
+                tables = self._tables.setdefault(segment_id, tables)
+        return tables[fieldname].get(text, [])
+
+    def retain(self, searcher):
+        """只保留searcher中仍存在的段的映射"""
+        segment_ids = {reader.segment().segment_id()
+                       for reader, _ in searcher.reader().leaf_readers() if hasattr(reader, "segment")}
+        with self._lock:
+            for segment_id in list(self._tables):
+                if segment_id not in segment_ids:
+                    del self._tables[segment_id]
+
+
+# 进程内共享的交易码子串索引
+code_index = CodeSubstringIndex()
+
+class CodeSubstring(Wildcard):
+    """交易码子串查询
+
+    匹配语义和评分与 Wildcard(fieldname, "*text*") 相同，但匹配的交易码
+    直接从子串索引中取得，不再遍历词典。
+    """
+
+    def __init__(self, fieldname, text, boost=1.0):
+        super().__init__(fieldname, f"*{text}*", boost=boost)
+        self.substring = text
+
+    def _btexts(self, ixreader):
+        return code_index.lookup(ixreader, self.fieldname, self.substring)
+
+
+class IndexManager:
+    """进程级索引管理器
+
+    整个进程共用一个已打开的Index和一个常驻的searcher，避免每次搜索都重新
+    打开段文件和TOC。索引提交后把searcher标记为过期，下次取用时通过
+    searcher.refresh()增量刷新；同时定期检查其他进程的提交。
+
+    锁只保护刷新和替换searcher引用，搜索本身在锁外并发执行。refresh()会关闭
+    新searcher用不到的段，所以旧searcher仍有搜索在用时改为重新打开一个，
+    旧的等最后一个使用者退出后再关闭。
+
+    当前使用的索引名记录在索引目录的CURRENT文件中（缺省为Whoosh默认的MAIN），
+    全量重建时在同一目录下建一个新名字的索引，建好后原子替换CURRENT文件完成切换。
+    """
+
+    # 检查其他进程提交的间隔（秒）
+    REFRESH_INTERVAL = 5.0
+    # 打开searcher时遇到TOC文件被并发提交删除的重试次数
+    OPEN_RETRIES = 5
+    POINTER_FILE = "CURRENT"
+    DEFAULT_INDEXNAME = "MAIN"
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._lock = threading.RLock()
+        self._ix = None
+        self._searcher = None
+        # id(searcher) -> 正在使用它的搜索数；已被替换、等待使用者退出后关闭的searcher
+        self._users: Dict[int, int] = {}
+        self._retired = []
+        self._dirty = False
+        self._last_check = 0.0
+        self._listeners = []
+        self.indexname = self._read_pointer()
+        self.reset_stats()
+
+    def add_listener(self, callback):
+        """注册索引变化（本进程提交或其他进程提交后刷新）时的回调"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"索引变化回调出错: {str(e)}")
+
+    def _read_pointer(self) -> str:
+        try:
+            with open(os.path.join(self.index_dir, self.POINTER_FILE), encoding="utf-8") as f:
+                return f.read().strip() or self.DEFAULT_INDEXNAME
+        except FileNotFoundError:
+            return self.DEFAULT_INDEXNAME
+
+    def _check_pointer(self):
+        """其他进程完成重建后切换到新索引"""
+        indexname = self._read_pointer()
+        if indexname != self.indexname:
+            self._close()
+            self.indexname = indexname
+            self._notify()
+
+    def generation(self) -> Tuple[str, int]:
+        """（当前索引名, 最新提交的代数），每次都从索引目录读取
+
+        其他进程的提交和全量重建后的切换也会立即反映出来，进程内按索引缓存的数据
+        在每次查找时与它比较，不必等本进程刷新searcher或缓存过期。
+        """
+        indexname = self._read_pointer()
+        if indexname != self.indexname or not self.exists():
+            return indexname, -1
+        return indexname, self.get_index().latest_generation()
+
+    def exists(self) -> bool:
+        """索引目录中是否已有索引
+
+        已打开时直接返回，exists_in会重新读取TOC，与并发提交删除旧TOC冲突。
+        """
+        if self._ix is not None:
+            return True
+        return exists_in(self.index_dir, indexname=self.indexname)
+
+    def get_index(self):
+        """获取共享的Index对象，首次调用时打开"""
+        with self._lock:
+            if self._ix is None:
+                self._ix = open_dir(self.index_dir, indexname=self.indexname)
+            return self._ix
+
+    def create(self, schema):
+        """新建空索引并替换当前打开的索引"""
+        with self._lock:
+            self._close()
+            self._ix = create_in(self.index_dir, schema=schema, indexname=self.indexname)
+            return self._ix
+
+    def writer(self, **kwargs):
+        """获取共享索引的writer"""
+        with self._lock:
+            self._check_pointer()
+            return self.get_index().writer(**kwargs)
+
+    def swap(self, indexname: str):
+        """原子切换到新建好的索引，并删除旧索引文件"""
+        with self._lock:
+            old_indexname = self.indexname
+            pointer = os.path.join(self.index_dir, self.POINTER_FILE)
+            with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+                f.write(indexname)
+            os.replace(pointer + ".tmp", pointer)
+            self._close()
+            self.indexname = indexname
+            self.get_index()
+            self._notify()
+        if old_indexname != indexname:
+            remove_index_files(self.index_dir, old_indexname)
+
+    def mark_dirty(self):
+        """索引已提交，下次取searcher时刷新"""
+        self._dirty = True
+        self._notify()
+
+    def _open(self, open_searcher):
+        """打开或刷新searcher
+
+        Whoosh先列出最新的TOC再读取，其间写入线程提交会删除这个TOC文件，
+        此时重新读取最新的TOC。
+        """
+        for attempt in range(self.OPEN_RETRIES):
+            try:
+                return open_searcher()
+            except FileNotFoundError:
+                if attempt == self.OPEN_RETRIES - 1:
+                    raise
+                time.sleep(0.001)
+
+    def _refresh_searcher(self, searcher):
+        """返回最新提交的searcher，旧searcher仍在使用时不复用它的段"""
+        if not self._users.get(id(searcher)):
+            return self._open(searcher.refresh)
+        if self.get_index().latest_generation() == searcher.reader().generation():
+            return searcher
+        new_searcher = self._open(self.get_index().searcher)
+        self._retire(searcher)
+        return new_searcher
+
+    def _retire(self, searcher):
+        """替换下来的searcher：没有使用者时立即关闭，否则等最后一个使用者退出"""
+        if self._users.get(id(searcher)):
+            self._retired.append(searcher)
+        else:
+            searcher.close()
+
+    def _release(self, searcher):
+        count = self._users[id(searcher)] - 1
+        if count:
+            self._users[id(searcher)] = count
+            return
+        del self._users[id(searcher)]
+        if any(retired is searcher for retired in self._retired):
+            self._retired = [retired for retired in self._retired if retired is not searcher]
+            searcher.close()
+
+    @contextmanager
+    def searcher(self):
+        """取得常驻searcher，必要时先刷新到最新提交
+
+        只在刷新和登记使用时持锁，搜索在锁外进行，Whoosh的searcher支持并发读。
+        """
+        with self._lock:
+            previous = self._searcher
+            if self._searcher is None:
+                self._searcher = self._open(self.get_index().searcher)
+                self._dirty = False
+                self._last_check = time.monotonic()
+            else:
+                now = time.monotonic()
+                if now - self._last_check > self.REFRESH_INTERVAL:
+                    self._check_pointer()
+                if self._searcher is None:
+                    self._searcher = self._open(self.get_index().searcher)
+                    self._dirty = False
+                    self._last_check = now
+                elif self._dirty or now - self._last_check > self.REFRESH_INTERVAL:
+                    searcher = self._refresh_searcher(self._searcher)
+                    if searcher is not self._searcher and not self._dirty:
+                        # 其他进程提交了变更
+                        self._notify()
+                    self._searcher = searcher
+                    self._dirty = False
+                    self._last_check = now
+            searcher = self._searcher
+            if searcher is not previous:
+                code_index.retain(searcher)
+            self._users[id(searcher)] = self._users.get(id(searcher), 0) + 1
+        try:
+            yield searcher
+        finally:
+            with self._lock:
+                self._release(searcher)
+
+    def record(self, elapsed_ms: float):
+        """记录一次搜索耗时"""
+        with self._lock:
+            self.stats["searches"] += 1
+            self.stats["total_ms"] += elapsed_ms
+            self.stats["last_ms"] = elapsed_ms
+            self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+
+    def reset_stats(self):
+        """清空搜索耗时统计"""
+        with self._lock:
+            self.stats = {"searches": 0, "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取搜索耗时统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["avg_ms"] = stats["total_ms"] / stats["searches"] if stats["searches"] else 0.0
+        return stats
+
+    def _close_searcher(self):
+        if self._searcher is not None:
+            self._retire(self._searcher)
+            self._searcher = None
+
+    def _close(self):
+        self._close_searcher()
+        if self._ix is not None:
+            self._ix.close()
+            self._ix = None
+
+    def close(self):
+        """关闭searcher和索引，应用停止时调用"""
+        with self._lock:
+            self._close()
+
+
+def remove_index_files(index_dir: str, indexname: str):
+    """删除指定索引名的TOC、段文件和锁文件"""
+    pattern = re.compile(rf"^(_{re.escape(indexname)}_\d+\.toc|{re.escape(indexname)}_([a-z0-9]{{16}}\.[\w.]+|WRITELOCK|READLOCK))$")
+    for filename in os.listdir(index_dir):
+        if pattern.match(filename):
+            try:
+                os.remove(os.path.join(index_dir, filename))
+            except OSError as e:
+                print(f"删除旧索引文件出错: {str(e)}")
+
+
+# 进程内共享的索引管理器
+index_manager = IndexManager(INDEX_DIR)
+
+if settings.SEARCH_VECTOR_ENABLED:
+    # 索引提交或切换后在后台为新段生成向量
+    vector_index.searcher_factory = index_manager.searcher
+    index_manager.add_listener(vector_index.request_build)
+
+def topic_document(topic: Topic) -> Dict[str, Any]:
+    """把Topic转换为索引文档"""
+    return dict(
+        id=str(topic.id),
+        topic_id=topic.topicId,
+        description=topic.description,
+        keywords=topic.keywords or "",
+        in_trcd=topic.inTrcd,
+        trcd=topic.trcd,
+        topic_type=topic.topicType,
+        operator=topic.operator,
+        addition=topic.addition,
+    )
+
+def iter_topic_pages(db: Session, page_size: int):
+    """按主键分页读取未删除的Topic，避免一次把整个题库载入内存"""
+    last_id = 0
+    while True:
+        page = db.query(Topic).filter(Topic.isDeleted == False, Topic.id > last_id).order_by(Topic.id).limit(page_size).all()
+        if not page:
+            break
+        yield page
+        last_id = page[-1].id
+        # 释放已写入索引的对象
+        db.expunge_all()
+
+def write_topics(ix, db: Session, procs: int = 1) -> int:
+    """把所有未删除的Topic写入索引，返回写入的文档数
+
+    procs大于1时使用Whoosh的多进程writer，由子进程并行分词并各自生成段，
+    提交时合并为一个段。多进程writer会fork，只能在单线程的进程中使用，
+    服务进程中请调用write_all_topics。
+    """
+    writer = ix.writer(procs=procs, limitmb=settings.SEARCH_REBUILD_LIMITMB)
+    count = 0
+    try:
+        for page in iter_topic_pages(db, settings.SEARCH_REBUILD_PAGE_SIZE):
+            for topic in page:
+                writer.add_document(**topic_document(topic))
+                count += 1
+    except Exception:
+        writer.cancel()
+        raise
+    writer.commit()
+    return count
+
+def write_index(index_dir: str, indexname: str, procs: int) -> int:
+    """在子进程中打开索引并写入全部Topic，由write_all_topics调用"""
+    ix = open_dir(index_dir, indexname=indexname)
+    try:
+        with session_scope() as db:
+            return write_topics(ix, db, procs)
+    finally:
+        ix.close()
+
+def write_all_topics(ix, db: Session) -> int:
+    """把所有未删除的Topic写入索引，返回写入的文档数
+
+    题库达到SEARCH_REBUILD_PARALLEL_MIN时，在spawn方式启动的子进程中用多进程writer写入。
+    多进程writer用fork创建分词进程，直接从有推理、索引更新等线程的服务进程fork，
+    子进程可能继承其他线程持有的锁而死锁；spawn出来的子进程只有一个线程，从它fork是安全的。
+    """
+    total = db.query(func.count(Topic.id)).filter(Topic.isDeleted == False).scalar()
+    procs = settings.SEARCH_REBUILD_PROCS
+    if procs <= 1 or total < settings.SEARCH_REBUILD_PARALLEL_MIN:
+        return write_topics(ix, db)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(write_index, ix.storage.folder, ix.indexname, procs).result()
+
 def create_index(db: Session):
     """创建Topic表的索引"""
     # 创建索引
-    ix = create_in(INDEX_DIR, schema=topic_schema)
-    
-    # 获取writer
-    writer = ix.writer()
-    
-    # 获取所有未删除的Topic
-    topics = db.query(Topic).filter(Topic.isDeleted == False).all()
+    ix = index_manager.create(topic_schema)
     
-    # 将Topic添加到索引
-    for topic in topics:
-        writer.add_document(
-            id=str(topic.id),
-            topic_id=topic.topicId,
-            description=topic.description,
-            keywords=topic.keywords or "",
-            in_trcd=topic.inTrcd,
-            trcd=topic.trcd,
-            topic_type=topic.topicType,
-            operator=topic.operator,
-            addition=topic.addition,
-        )
-    
-    # 提交更改
-    writer.commit()
+    # 将Topic添加到索引并提交
+    write_all_topics(ix, db)
+    index_manager.mark_dirty()
 
 def update_index(topic: Topic):
     """更新单个Topic索引"""
     try:
-        ix = open_dir(INDEX_DIR)
-        writer = ix.writer()
+        writer = index_manager.writer()
         
         # 首先删除现有文档（如果存在）
         writer.delete_by_term('topic_id', topic.topicId)
         
         # 添加新文档
-        writer.add_document(
-            id=str(topic.id),
-            topic_id=topic.topicId,
-            description=topic.description,
-            keywords=topic.keywords or "",
-            in_trcd=topic.inTrcd,
-            trcd=topic.trcd,
-            topic_type=topic.topicType,
-            operator=topic.operator,
-            addition=topic.addition,
-        )
+        writer.add_document(**topic_document(topic))
         
         writer.commit()
+        index_manager.mark_dirty()
         return True
     except Exception as e:
         print(f"更新索引出错: {str(e)}")
@@ -97,15 +544,265 @@ def update_index(topic: Topic):
 def delete_from_index(topic_id: str):
     """从索引中删除Topic"""
     try:
-        ix = open_dir(INDEX_DIR)
-        writer = ix.writer()
+        writer = index_manager.writer()
         writer.delete_by_term('topic_id', topic_id)
         writer.commit()
+        index_manager.mark_dirty()
         return True
     except Exception as e:
         print(f"从索引中删除出错: {str(e)}")
         return False
 
+class IndexUpdateQueue:
+    """Topic变更的缓冲写入队列
+
+    题库接口只负责把变更放进队列，后台线程按批合并（同一Topic只保留最后一次
+    变更），每批只用一个writer提交一次。索引被其他writer锁住时保留变更，
+    下个周期重试。
+    """
+
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # topic_id -> (入队时间, 索引文档；None表示删除)
+        self._pending = OrderedDict()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # 全量重建期间记录的变更，重建切换后重放到新索引
+        self._captured = None
+        self.last_commit_at = None
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.committed = 0
+        self.errors = 0
+
+    def put(self, topic: Topic):
+        """加入一个新增或修改的Topic，已删除的Topic按删除处理"""
+        if topic.isDeleted:
+            self.delete(topic.topicId)
+        else:
+            self._enqueue(topic.topicId, topic_document(topic))
+
+    def delete(self, topic_id: str):
+        """加入一个删除的Topic"""
+        self._enqueue(topic_id, None)
+
+    def _enqueue(self, topic_id: str, document: Optional[Dict[str, Any]]):
+        with self._lock:
+            # 合并同一Topic的多次变更，但保留最早的入队时间用于计算延迟
+            queued_at = self._pending.pop(topic_id, (time.time(), None))[0]
+            self._pending[topic_id] = (queued_at, document)
+            if self._captured is not None:
+                self._captured[topic_id] = document
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def begin_capture(self):
+        """开始记录变更，供全量重建结束后重放"""
+        with self._lock:
+            self._captured = OrderedDict()
+
+    def end_capture(self, replay: bool):
+        """停止记录变更，replay为True时把记录的变更重新入队"""
+        with self._lock:
+            captured, self._captured = self._captured or {}, None
+        if replay:
+            for topic_id, document in captured.items():
+                self._enqueue(topic_id, document)
+        return len(captured)
+
+    def flush(self) -> int:
+        """把队列中的变更写入索引，返回本次提交的文档数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = OrderedDict()
+        start = time.perf_counter()
+        try:
+            writer = index_manager.writer()
+            for topic_id, (_, document) in batch.items():
+                writer.delete_by_term('topic_id', topic_id)
+                if document is not None:
+                    writer.add_document(**document)
+            writer.commit()
+        except Exception as e:
+            print(f"批量更新索引出错: {str(e)}")
+            self.errors += 1
+            # 放回队列等待下次重试，期间的新变更优先
+            with self._lock:
+                for topic_id, change in batch.items():
+                    if topic_id not in self._pending:
+                        self._pending[topic_id] = change
+                        self._pending.move_to_end(topic_id, last=False)
+            return 0
+        index_manager.mark_dirty()
+        self.last_commit_at = time.time()
+        self.last_batch_size = len(batch)
+        self.last_batch_ms = (time.perf_counter() - start) * 1000
+        self.committed += len(batch)
+        return len(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="index-updates", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台线程并写入剩余变更"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def get_lag(self) -> Dict[str, Any]:
+        """获取索引延迟：未提交的变更数和最早一条变更已等待的秒数"""
+        now = time.time()
+        with self._lock:
+            pending = len(self._pending)
+            oldest = min((queued_at for queued_at, _ in self._pending.values()), default=None)
+        return {
+            "pending": pending,
+            "lag_seconds": now - oldest if oldest is not None else 0.0,
+            "last_commit_at": self.last_commit_at,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": self.last_batch_ms,
+            "committed": self.committed,
+            "errors": self.errors,
+            "running": self._thread is not None,
+        }
+
+
+# 进程内共享的索引变更队列
+index_updates = IndexUpdateQueue(settings.SEARCH_INDEX_FLUSH_INTERVAL, settings.SEARCH_INDEX_BATCH_SIZE)
+
+
+class IndexRebuilder:
+    """全量重建索引
+
+    在索引目录下用新的索引名建一个暂存索引，分页读取题库并行写入，完成后
+    原子切换。重建期间聊天搜索继续使用旧索引，期间的题库变更在切换后重放。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {"running": False}
+
+    def run(self, db: Session) -> Dict[str, Any]:
+        """在当前线程执行重建，返回重建结果"""
+        with self._lock:
+            if self.status["running"]:
+                raise RuntimeError("索引正在重建")
+            self.status = {"running": True, "started_at": time.time()}
+        indexname = f"{IndexManager.DEFAULT_INDEXNAME}{int(time.time() * 1000)}"
+        start = time.perf_counter()
+        index_updates.begin_capture()
+        swapped = False
+        try:
+            ix = create_in(INDEX_DIR, schema=topic_schema, indexname=indexname)
+            try:
+                documents = write_all_topics(ix, db)
+            finally:
+                ix.close()
+            index_manager.swap(indexname)
+            swapped = True
+            self.status.update(documents=documents, indexname=indexname)
+        except Exception as e:
+            print(f"重建索引出错: {str(e)}")
+            remove_index_files(INDEX_DIR, indexname)
+            self.status["error"] = str(e)
+        finally:
+            self.status["replayed"] = index_updates.end_capture(replay=swapped)
+            self.status.update(
+                running=False,
+                finished_at=time.time(),
+                elapsed_ms=(time.perf_counter() - start) * 1000,
+            )
+        return dict(self.status)
+
+    def _run_in_background(self):
+        try:
+            with session_scope() as db:
+                self.run(db)
+        except RuntimeError:
+            pass
+
+    def start(self) -> bool:
+        """在后台线程启动重建，已有重建在进行时返回False"""
+        with self._lock:
+            if self.status["running"] or (self._thread is not None and self._thread.is_alive()):
+                return False
+            self._thread = threading.Thread(target=self._run_in_background, name="index-rebuild", daemon=True)
+            self._thread.start()
+            return True
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取最近一次重建的状态"""
+        return dict(self.status)
+
+
+index_rebuilder = IndexRebuilder()
+
+def hit_topic(fields, score: float) -> Dict[str, Any]:
+    """把索引中存储的字段转换为搜索结果
+
+    bm25_score是Whoosh原始分，判断是否可以直接作答等阈值都用它；
+    score是排序用的分数，启用向量检索时为融合分，否则与bm25_score相同。
+    """
+    return {
+        "id": fields["id"],
+        "topicId": fields["topic_id"],
+        "description": fields["description"],
+        "inTrcd": fields["in_trcd"],
+        "trcd": fields["trcd"],
+        "topicType": fields["topic_type"],
+        "operator": fields["operator"],
+        "addition": fields.get("addition"),
+        "bm25_score": score,
+        "score": score  # 添加相关性评分
+    }
+
+def fuse_vector_results(searcher, query_string: str, topics: List[Dict[str, Any]], docnums: List[int], limit: int) -> List[Dict[str, Any]]:
+    """把向量检索的结果与Whoosh结果融合
+
+    融合分 = (1 - w) * Whoosh分/本次最高Whoosh分 + w * 余弦相似度。
+    只由向量召回的话题需要相似度不低于SEARCH_VECTOR_MIN_SCORE，其bm25_score为0。
+    融合后score为融合分并按它排序，bm25_score保留Whoosh原始分，另附vector_score。
+    段的向量还在后台生成时只按Whoosh分排序。
+    """
+    weight = settings.SEARCH_VECTOR_WEIGHT
+    similarities = vector_index.search(searcher, [query_string], limit, include=docnums)
+    if similarities is None:
+        topics.sort(key=lambda x: x["score"], reverse=True)
+        return topics
+    similarities = similarities[0]
+    max_score = max((topic["bm25_score"] for topic in topics), default=0.0) or 1.0
+    for topic, docnum in zip(topics, docnums):
+        topic["vector_score"] = similarities.pop(docnum, 0.0)
+        topic["score"] = (1 - weight) * topic["bm25_score"] / max_score + weight * topic["vector_score"]
+    for docnum, similarity in similarities.items():
+        if similarity >= settings.SEARCH_VECTOR_MIN_SCORE:
+            topic = hit_topic(searcher.stored_fields(docnum), 0.0)
+            topic["vector_score"] = similarity
+            topic["score"] = weight * similarity
+            topics.append(topic)
+    topics.sort(key=lambda x: x["score"], reverse=True)
+    return topics[:limit]
+
 def search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
     """搜索Topics
     
@@ -116,31 +813,29 @@ def search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
     Returns:
         匹配的Topic列表
     """
+    start = time.perf_counter()
     try:
         # 确保索引目录存在
-        if not os.path.exists(INDEX_DIR) or not os.listdir(INDEX_DIR):
+        if not index_manager.exists():
             return []
             
-        # 打开索引
-        ix = open_dir(INDEX_DIR)
-        
         # 对查询词进行中文分词
-        terms = ' OR '.join(jieba.cut(query_string))
+        terms = ' OR '.join(segment_cache.cut(query_string))
         search_query = terms if terms else query_string
         
         # 检查是否有数字，用于前缀匹配
         has_digits = bool(re.search(r'\d', query_string))
         
-        with ix.searcher() as searcher:
+        with index_manager.searcher() as searcher:
             # 构建查询
             queries = []
             
             # 1. 常规多字段搜索
             # parser = MultifieldParser(["description", "keywords", "operator", "topic_type"], 
-            #                          ix.schema, 
+            #                          searcher.schema, 
             #                          group=OrGroup.factory(0.9))
             parser = MultifieldParser(["description", "keywords", "topic_type"], 
-                                     ix.schema, 
+                                     searcher.schema, 
                                      group=OrGroup.factory(0.9))
             parser.add_plugin(WildcardPlugin())
             parser.add_plugin(PrefixPlugin())
@@ -153,8 +848,8 @@ def search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
                 if digits:
                     # 添加前缀匹配
                     queries.append(Or([Prefix("trcd", digits), Prefix("in_trcd", digits)]))
-                    # 添加通配符匹配 (例如: *21076*)
-                    queries.append(Or([Wildcard("trcd", f"*{digits}*"), Wildcard("in_trcd", f"*{digits}*")]))
+                    # 添加子串匹配 (例如: *21076*)
+                    queries.append(Or([CodeSubstring("trcd", digits), CodeSubstring("in_trcd", digits)]))
             
             # 组合所有查询为一个OR查询
             combined_query = Or(queries)
@@ -165,18 +860,11 @@ def search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
             # 格式化返回结果
             topics = []
             for hit in results:
-                topics.append({
-                    "id": hit["id"],
-                    "topicId": hit["topic_id"],
-                    "description": hit["description"],
-                    "inTrcd": hit["in_trcd"],
-                    "trcd": hit["trcd"],
-                    "topicType": hit["topic_type"],
-                    "operator": hit["operator"],
-                    "addition": hit["addition"],
-                    "score": hit.score  # 添加相关性评分
-                })
+                topics.append(hit_topic(hit, hit.score))
             
+            if settings.SEARCH_VECTOR_ENABLED:
+                return fuse_vector_results(searcher, query_string, topics, [hit.docnum for hit in results], limit)
+
             # 根据评分排序
             topics.sort(key=lambda x: x["score"], reverse=True)
             
@@ -184,9 +872,103 @@ def search_topics(query_string: str, limit: int = 10) -> List[Dict[str, Any]]:
     except Exception as e:
         print(f"搜索出错: {str(e)}")
         return []
+    finally:
+        index_manager.record((time.perf_counter() - start) * 1000)
 
 def init_search_index(db: Session):
     """初始化搜索索引"""
     # 检查索引目录是否存在，如果不存在则创建
-    if not os.path.exists(INDEX_DIR) or not os.listdir(INDEX_DIR):
-        create_index(db) 
\ No newline at end of file
+    if not index_manager.exists():
+        create_index(db)
+
+def load_user_dict(db: Session) -> int:
+    """把问题关键词和交易码加入jieba用户词典，返回加入的词数"""
+    words = set()
+    topics = db.query(Topic.keywords, Topic.inTrcd, Topic.trcd).filter(Topic.isDeleted == False).all()
+    for keywords, in_trcd, trcd in topics:
+        if keywords:
+            words.update(w.strip() for w in re.split(r'[,，]', keywords))
+        words.update(code.strip() for code in (in_trcd or "").split(","))
+        words.update(code.strip() for code in (trcd or "").split(","))
+    words.discard("")
+    for word in words:
+        jieba.add_word(word)
+    # 词典变化后原有分词结果失效
+    segment_cache.clear()
+    return len(words)
+
+def warm_up_search(db: Session) -> Dict[str, Any]:
+    """预热jieba词典和搜索索引
+
+    依次加载jieba前缀词典、（可选）用户词典，确保索引存在并打开，
+    最后执行几条预设查询，让第一条真实请求不用承担冷启动开销。
+    返回各阶段耗时（毫秒）。
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    jieba.initialize()
+    timings["jieba_ms"] = (time.perf_counter() - start) * 1000
+
+    if settings.SEARCH_USER_DICT_ENABLED:
+        start = time.perf_counter()
+        timings["user_dict_words"] = load_user_dict(db)
+        timings["user_dict_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    init_search_index(db)
+    index_manager.get_index()
+    if settings.SEARCH_VECTOR_ENABLED:
+        vector_index.request_build()
+    timings["index_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    queries = list(settings.SEARCH_WARMUP_QUERIES)
+    hot_topics = db.query(Topic.description).filter(Topic.isDeleted == False).order_by(Topic.order).limit(5).all()
+    queries.extend(description for description, in hot_topics)
+    for query in queries:
+        search_topics(query, 5)
+    timings["queries"] = len(queries)
+    timings["queries_ms"] = (time.perf_counter() - start) * 1000
+
+    # 预热查询不计入线上耗时统计
+    index_manager.reset_stats()
+    return timings
+
+def get_search_stats() -> Dict[str, Any]:
+    """获取搜索耗时和分词缓存统计"""
+    stats = index_manager.get_stats()
+    stats["segment_cache"] = segment_cache.get_stats()
+    stats["code_index_builds"] = code_index.builds
+    stats["vector_index"] = vector_index.get_stats()
+    return stats
+
+def get_index_lag() -> Dict[str, Any]:
+    """获取索引变更延迟"""
+    return index_updates.get_lag()
+
+def rebuild_index(db: Session) -> Dict[str, Any]:
+    """全量重建索引并原子切换"""
+    return index_rebuilder.run(db)
+
+def start_index_updates():
+    """启动索引变更的后台写入"""
+    index_updates.start()
+
+def close_search_index():
+    """写入剩余变更并关闭共享索引"""
+    index_updates.stop()
+    vector_index.stop()
+    index_manager.close() 
+
+
+if __name__ == "__main__":
+    # 命令行全量重建: python search.py rebuild
+    import sys
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法: python search.py rebuild")
+        sys.exit(1)
+    # 通过模块名导入，索引schema中序列化的分析器类才是search.ChineseAnalyzer而不是__main__中的
+    import search
+    with session_scope() as db:
+        print(search.rebuild_index(db))
@@ -0,0 +1,55 @@
+"""测试公共配置
+
+后端模块按目录平铺导入（from config import settings），这里把backend目录加入sys.path；
+数据库改用临时目录下的SQLite文件，不影响 backend/database/app.db。
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault(
+    "SQLITE_DATABASE_URI",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="backend-tests-"), "app.db"),
+)
+
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def seeded_db():
+    """建表并写入几个机构的对话（带消息和调查）和题库问题，整个测试会话只写一次"""
+    from datetime import datetime, timedelta
+
+    from database.config import init_db, session_scope
+    from database.models import Chat, Message, Org, Session, Survey, Topic
+
+    init_db()
+    start = datetime(2025, 1, 1, 9)
+    with session_scope() as db:
+        for n in range(3):
+            org_code = f"9{n:03d}"
+            db.add(Org(orgCode=org_code, orgName=f"测试支行{n}", password="x"))
+            session = Session(orgCode=org_code)
+            db.add(session)
+            db.flush()
+            for i in range(40):
+                chat = Chat(sessionId=session.sessionId, chatName=f"对话{n}-{i}",
+                            createdAt=start + timedelta(hours=i, minutes=n))
+                db.add(chat)
+                db.flush()
+                db.add_all([
+                    Message(chatId=chat.chatId, content="如何开户", sender="user", status="success"),
+                    Message(chatId=chat.chatId, content="请携带证件", sender="assistant", status="success"),
+                ])
+                if i % 2:
+                    db.add(Survey(chatId=chat.chatId, solved="no" if i % 4 == 1 else "yes",
+                                  createdAt=chat.createdAt + timedelta(minutes=5)))
+        for i in range(60):
+            db.add(Topic(inTrcd=f"{i:06d}", trcd=f"{i:06d}", topicType="对公" if i % 2 else "对私",
+                         description=f"问题{i}", operator=f"操作说明{i}", keywords="开户,账户", order=i % 7))
+        db.commit()
@@ -0,0 +1,54 @@
+from whoosh.index import create_in
+
+from cache import TopicMap, TTLCache
+from database.config import session_scope
+from database.models import Topic
+from search import IndexManager, topic_schema
+
+
+def add_topic(writer, id: str):
+    writer.add_document(id=id, topic_id=id, description=f"问题{id}", keywords="", in_trcd="", trcd="",
+                        topic_type="业务咨询", operator="答案", addition="")
+
+
+def test_other_worker_commit_invalidates(tmp_path):
+    """两个IndexManager共用索引目录，相当于两个worker：一个提交后另一个的缓存在下次查找时失效"""
+    ix = create_in(str(tmp_path), topic_schema)
+    with ix.writer() as writer:
+        add_topic(writer, "1")
+    worker, other = IndexManager(str(tmp_path)), IndexManager(str(tmp_path))
+    cache = TTLCache(10, 600, worker.generation)
+
+    version = cache.version
+    cache.set("q", "旧回复", version)
+    assert cache.get("q") == "旧回复"
+
+    # 在计算期间其他worker提交，旧结果不写入
+    version = cache.version
+    writer = other.writer()
+    add_topic(writer, "2")
+    writer.commit()
+    assert cache.get("q") is None
+    cache.set("q", "计算期间的回复", version)
+    assert cache.get("q") is None
+
+    cache.set("q", "新回复", cache.version)
+    assert cache.get("q") == "新回复"
+    assert cache.get_stats()["stale"] == 1
+    worker.close()
+    other.close()
+
+
+def test_topic_map_reloads_on_generation_change(seeded_db):
+    generation = [1]
+    topic_map = TopicMap(600, lambda: generation[0])
+    with session_scope() as db:
+        assert topic_map.get(db, "问题1")["description"] == "问题1"
+        db.add(Topic(inTrcd="", trcd="", topicType="业务咨询", description="其他worker新增的问题", operator="答案"))
+        db.commit()
+        assert topic_map.get(db, "其他worker新增的问题") is None
+        assert topic_map.loads == 1
+
+        generation[0] += 1
+        assert topic_map.get(db, "其他worker新增的问题")["operator"] == "答案"
+        assert topic_map.loads == 2
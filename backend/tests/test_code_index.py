@@ -0,0 +1,48 @@
+from whoosh.index import create_in
+from whoosh.query import Or
+
+import search
+from search import CodeSubstring, CodeSubstringIndex, IndexManager, topic_schema
+
+
+def add_topic(writer, id: str, trcd: str):
+    writer.add_document(id=id, topic_id=id, description=f"问题{id}", keywords="", in_trcd=trcd, trcd=trcd,
+                        topic_type="交易画面录入", operator="答案", addition="")
+
+
+def search_codes(manager: IndexManager, digits: str):
+    with manager.searcher() as searcher:
+        query = Or([CodeSubstring("trcd", digits), CodeSubstring("in_trcd", digits)])
+        return sorted(hit["trcd"] for hit in searcher.search(query))
+
+
+def test_commit_only_builds_new_segment(tmp_path, monkeypatch):
+    code_index = CodeSubstringIndex()
+    monkeypatch.setattr(search, "code_index", code_index)
+    ix = create_in(str(tmp_path), topic_schema)
+    with ix.writer() as writer:
+        add_topic(writer, "1", "021076")
+        add_topic(writer, "2", "055067")
+    manager = IndexManager(str(tmp_path))
+
+    assert search_codes(manager, "107") == ["021076"]
+    assert code_index.builds == 1
+
+    # 再次提交一个新段，刷新后的searcher重新打开了段reader，但旧段不需要重建
+    writer = manager.writer()
+    add_topic(writer, "3", "310762")
+    writer.commit(merge=False)
+    manager.mark_dirty()
+    assert search_codes(manager, "076") == ["021076", "310762"]
+    assert code_index.builds == 2
+    assert search_codes(manager, "0676") == []
+    assert code_index.builds == 2
+
+    # 合并成一个段后，被合并掉的段的映射随之删除
+    writer = manager.writer()
+    writer.commit(optimize=True)
+    manager.mark_dirty()
+    assert search_codes(manager, "5506") == ["055067"]
+    assert code_index.builds == 3
+    assert len(code_index._tables) == 1
+    manager.close()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from database.config import async_engine, async_session_scope
+from database.crud import chat as chat_crud, topic as topic_crud
+
+
+class StatementCounter:
+    """统计with块内异步引擎执行的SQL语句数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("page_size", [1, 10, 100])
+def test_chat_list_statements(seeded_db, page_size):
+    """对话列表一页固定两条语句：主查询JOIN会话和机构，调查一条IN查询，访问关联对象不再查询"""
+    async def list_page():
+        async with async_session_scope() as db:
+            with StatementCounter() as counter:
+                chats = await chat_crud.getByFilter(db, limit=page_size)
+                for chat in chats:
+                    chat.session.organization.orgName, chat.survey
+            return chats, counter.count
+
+    chats, statements = run(list_page())
+    assert len(chats) == page_size
+    assert statements == 2
+
+
+@pytest.mark.parametrize("page_size", [1, 10, 25])
+def test_topic_list_statements(seeded_db, page_size):
+    """题库列表一页固定两条语句：分页查询和总数"""
+    async def list_page():
+        async with async_session_scope() as db:
+            with StatementCounter() as counter:
+                topics = await topic_crud.getByFilter(db, limit=page_size, questionType="对公")
+                total = await topic_crud.countByFilter(db, questionType="对公")
+            return topics, total, counter.count
+
+    topics, total, statements = run(list_page())
+    assert len(topics) == page_size
+    assert total >= 30
+    assert statements == 2
@@ -0,0 +1,137 @@
+import threading
+
+import inference
+from inference import ConversationStore, TokenBudget
+
+
+class CharTokenizer:
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+class FakeChatbot:
+    """每个字符一个token的对话模板，未传system消息时模板自带一段默认的系统提示"""
+
+    tokenizer = CharTokenizer()
+
+    def render(self, messages):
+        if not messages or messages[0]["role"] != "system":
+            messages = [{"role": "system", "content": "默认系统提示"}] + messages
+        return "".join(f"<{m['role']}>{m['content']}</>" for m in messages) + "<assistant>"
+
+    def encode(self, text, prefix_text="", prefix_ids=()):
+        return [ord(c) for c in text]
+
+
+def conversation(turns):
+    messages = [{"role": "system", "content": "你是银行业务咨询助手"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}" * 5})
+        messages.append({"role": "assistant", "content": f"回答{i}" * 5})
+    messages.append({"role": "user", "content": "最后的问题"})
+    return messages
+
+
+def test_trim_drops_whole_turns_and_keeps_system():
+    chatbot = FakeChatbot()
+    messages = conversation(6)
+    budget = TokenBudget(200, 64, 10)
+    kept, ids = budget.trim(chatbot, messages)
+
+    assert len(ids) <= 200 * 0.75
+    assert ids == chatbot.encode(chatbot.render(kept))
+    assert kept[0] == messages[0]
+    # 保留的是最近的若干完整轮次
+    assert kept[1]["role"] == "user"
+    assert kept[1:] == messages[len(messages) - len(kept) + 1:]
+    assert kept[-1]["content"] == "最后的问题"
+
+
+def test_trim_without_system_keeps_template_prefix():
+    chatbot = FakeChatbot()
+    messages = conversation(6)[1:]
+    kept, ids = TokenBudget(150, 64, 10).trim(chatbot, messages)
+    assert chatbot.tokenizer.decode(ids).startswith("<system>默认系统提示</>")
+    assert kept[0]["role"] == "user"
+
+
+def test_trim_shortens_last_message_not_prompt():
+    chatbot = FakeChatbot()
+    messages = [{"role": "system", "content": "你是银行业务咨询助手"},
+                {"role": "user", "content": "很长的问题" * 100 + "结尾"}]
+    kept, ids = TokenBudget(120, 64, 10).trim(chatbot, messages)
+    text = chatbot.tokenizer.decode(ids)
+
+    assert len(ids) == 120
+    assert text.startswith("<system>你是银行业务咨询助手</><user>")
+    assert text.endswith("结尾</><assistant>")
+    assert kept[0] == messages[0]
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}"})
+        messages.append({"role": "assistant", "content": f"回答{i}"})
+    return messages + [{"role": "user", "content": "新问题"}]
+
+
+def test_sync_extends_cached_prompt(monkeypatch):
+    monkeypatch.setattr(inference, "token_budget", TokenBudget(10000, 64, 10))
+    chatbot, store = FakeChatbot(), ConversationStore(10000, 600)
+    first = history(2)
+    conversation = store.sync("c", first)
+    ids = store.encode(chatbot, conversation)
+
+    second = first + [{"role": "assistant", "content": "回答"}, {"role": "user", "content": "追问"}]
+    assert store.sync("c", second) is conversation
+    assert conversation.messages == second
+    assert store.encode(chatbot, conversation)[:len(ids)] == ids
+    assert store.stats["reused_tokens"] == len(ids)
+
+    # 之前的消息变了（如编辑了历史）时按新消息重建
+    edited = [{"role": "user", "content": "改过的问题"}] + second[1:]
+    store.sync("c", edited)
+    assert conversation.messages == edited
+    store.encode(chatbot, conversation)
+    assert store.stats["reused_tokens"] == len(ids)
+
+
+def test_sync_keeps_trimmed_context(monkeypatch):
+    monkeypatch.setattr(inference, "token_budget", TokenBudget(150, 64, 10))
+    chatbot, store = FakeChatbot(), ConversationStore(10000, 600)
+    messages = history(8)
+    conversation = store.sync("c", messages)
+    ids = store.encode(chatbot, conversation)
+    trimmed = list(conversation.messages)
+    assert len(trimmed) < len(messages) and store.stats["trimmed"] == 1
+
+    # 调用方仍然传来完整的历史，只追加了新的一轮，裁剪后的上下文和编码缓存继续使用
+    new_turn = [{"role": "assistant", "content": "好"}, {"role": "user", "content": "谢谢"}]
+    store.sync("c", messages + new_turn)
+    assert conversation.messages == trimmed + new_turn
+    store.encode(chatbot, conversation)
+    assert store.stats["trimmed"] == 1
+    assert store.stats["reused_tokens"] == len(ids)
+
+
+def test_token_accounting_under_concurrent_eviction(monkeypatch):
+    monkeypatch.setattr(inference, "token_budget", TokenBudget(10000, 64, 10))
+    chatbot, store = FakeChatbot(), ConversationStore(600, 600)
+
+    def worker(n):
+        for i in range(200):
+            chat_id = f"{n}-{i % 7}"
+            conversation = store.sync(chat_id, history(i % 5))
+            store.encode(chatbot, conversation)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = store.get_stats()
+    assert stats["evictions"] > 0
+    assert stats["cached_tokens"] == sum(c.counted_tokens for c in store._conversations.values())
+    assert 0 <= stats["cached_tokens"] <= 600
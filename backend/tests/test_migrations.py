@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, inspect
+
+from database.config import Base
+from database.migrations import MIGRATIONS, check_query_plans, upgrade
+
+
+def test_hot_queries_use_indexes(seeded_db):
+    """crud实际执行的热点查询在有数据的库上都不做全表扫描"""
+    results = check_query_plans()
+    assert set(results) and all("plan" in result for result in results.values())
+    scans = {name: result["full_scans"] for name, result in results.items() if result["full_scans"]}
+    assert scans == {}
+
+
+def test_upgrade_matches_models(tmp_path):
+    """按版本依次迁移后的索引与模型中声明的一致，旧版本替换掉的索引已删除"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    Base.metadata.create_all(bind=engine)
+    assert upgrade(engine) == [version for version, _, _ in MIGRATIONS]
+    assert upgrade(engine) == []
+
+    inspector = inspect(engine)
+    for table in ("chats", "messages", "surveys", "topics"):
+        expected = {index.name for index in Base.metadata.tables[table].indexes}
+        actual = {index["name"] for index in inspector.get_indexes(table)}
+        assert actual == expected, table
+    engine.dispose()
@@ -0,0 +1,25 @@
+from whoosh.index import create_in
+from whoosh.query import Every
+
+import search
+from config import settings
+from database.config import session_scope
+from database.models import Topic
+from search import topic_schema, write_all_topics
+
+
+def test_parallel_build_runs_in_spawned_process(seeded_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_REBUILD_PARALLEL_MIN", 1)
+    monkeypatch.setattr(settings, "SEARCH_REBUILD_PROCS", 2)
+    forks = []
+    monkeypatch.setattr(search, "write_topics", lambda *args: forks.append(args))
+
+    ix = create_in(str(tmp_path), schema=topic_schema, indexname="STAGING")
+    with session_scope() as db:
+        total = db.query(Topic).filter(Topic.isDeleted == False).count()
+        assert write_all_topics(ix, db) == total
+    # 多进程writer只在子进程中创建，本进程没有调用write_topics
+    assert forks == []
+    with ix.searcher() as searcher:
+        assert len(searcher.search(Every(), limit=None)) == total
+    ix.close()
@@ -0,0 +1,87 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session as DbSession
+
+from database.config import Base
+from database.models import Chat, DailyChatStats, Org, Session, Survey
+from database.stats import add_counts, apply_drift, count_daily_stats, find_drift, reconcile_by_day
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def add_chat(db, session, created_at, survey_at=None, solved="no"):
+    chat = Chat(sessionId=session.sessionId, chatName="对话", createdAt=created_at)
+    db.add(chat)
+    db.flush()
+    if survey_at is not None:
+        db.add(Survey(chatId=chat.chatId, solved=solved, createdAt=survey_at))
+    return chat
+
+
+def stats_rows(engine):
+    with engine.connect() as conn:
+        return {(day, org): (chats, unsolved) for day, org, chats, unsolved in conn.execute(
+            select(DailyChatStats.day, DailyChatStats.orgCode, DailyChatStats.chats, DailyChatStats.unsolved))}
+
+
+def test_surveys_counted_per_org_by_survey_date(engine):
+    with DbSession(engine) as db:
+        sessions = []
+        for org_code in ("1001", "1002"):
+            db.add(Org(orgCode=org_code, orgName=org_code, password="x"))
+            sessions.append(Session(orgCode=org_code))
+        db.add_all(sessions)
+        db.flush()
+        # 1月1日的对话在1月2日提交未解决调查：对话数记在1日，未解决数记在2日
+        add_chat(db, sessions[0], datetime(2025, 1, 1, 23), survey_at=datetime(2025, 1, 2, 9))
+        add_chat(db, sessions[0], datetime(2025, 1, 1, 10), survey_at=datetime(2025, 1, 1, 11), solved="yes")
+        add_chat(db, sessions[1], datetime(2025, 1, 2, 8), survey_at=datetime(2025, 1, 2, 8, 30))
+        db.commit()
+    with engine.begin() as conn:
+        # 统计表中有一行偏差和一行多余的数据
+        add_counts(conn, date(2025, 1, 1), "1001", 5, 0)
+        add_counts(conn, date(2024, 12, 31), "1002", 1, 1)
+
+    assert reconcile_by_day(engine) == 4
+    assert stats_rows(engine) == {
+        (date(2025, 1, 1), "1001"): (2, 0),
+        (date(2025, 1, 2), "1001"): (0, 1),
+        (date(2025, 1, 2), "1002"): (1, 1),
+    }
+    assert reconcile_by_day(engine) == 0
+
+
+def test_increments_during_reconcile_are_kept(engine):
+    with DbSession(engine) as db:
+        db.add(Org(orgCode="1001", orgName="1001", password="x"))
+        session = Session(orgCode="1001")
+        db.add(session)
+        db.flush()
+        add_chat(db, session, datetime(2025, 1, 1, 9))
+        db.commit()
+        session_id = session.sessionId
+
+    with engine.connect() as conn:
+        drift = find_drift(conn)
+    assert drift == {date(2025, 1, 1): {"1001": (1, 0)}}
+
+    # 算出差值之后、写入之前，另一个请求新建了对话并增量更新了统计
+    with DbSession(engine) as db:
+        add_chat(db, db.query(Session).filter_by(sessionId=session_id).one(), datetime(2025, 1, 1, 10))
+        db.commit()
+    with engine.begin() as conn:
+        add_counts(conn, date(2025, 1, 1), "1001", 1, 0)
+
+    with engine.begin() as conn:
+        apply_drift(conn, date(2025, 1, 1), drift[date(2025, 1, 1)])
+    assert stats_rows(engine) == {(date(2025, 1, 1), "1001"): (2, 0)}
+    with engine.connect() as conn:
+        assert count_daily_stats(conn) == {(date(2025, 1, 1), "1001"): [2, 0]}
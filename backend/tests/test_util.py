@@ -0,0 +1,32 @@
+import pytest
+
+from util import mask_sensitive, mask_sensitive_sequential
+
+GOLDEN = [
+    ("如何办理对公账户开户？", "如何办理对公账户开户？"),
+    ("021076交易报错", "021076交易报错"),
+    ("我的卡号6222020200112233445，姓名是张三丰", "我的卡号62***************45，姓***丰"),
+    ("客户名称为广州某某科技有限公司，邮箱abc@qq.com", "客户名***某某科技有限公司，邮箱a*c@qq.com"),
+    ("地址是广东省广州市天河区某某街道", "**街道"),
+    ("姓名：李四，身份证440101199001011234", "姓******证44**************34"),
+    ("联系邮箱 zhang.san@example.com", "联系邮箱 z*******n@example.com"),
+    ("12345678", "12345678"),
+    ("姓名是张三丰，住广东省广州市天河区某某镇", "姓***丰，**镇"),
+]
+
+
+@pytest.mark.parametrize("text,expected", GOLDEN)
+def test_mask_sensitive(text, expected):
+    assert mask_sensitive(text) == expected
+
+
+@pytest.mark.parametrize("text,expected", GOLDEN)
+def test_same_as_sequential_rules(text, expected):
+    # 规则命中的文本互不重叠时，单次扫描与逐条规则替换的结果相同
+    assert mask_sensitive_sequential(text) == expected
+
+
+def test_overlapping_name_prefixes():
+    # 一个姓名前缀紧跟另一个前缀时取最靠前的匹配，原实现先处理“名称是”
+    assert mask_sensitive("姓名是名称是abc") == "姓***是abc"
+    assert mask_sensitive_sequential("姓名是名称是abc") == "姓名是名***c"
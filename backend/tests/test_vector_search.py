@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+from whoosh.index import create_in
+from whoosh.qparser import MultifieldParser, OrGroup
+
+import search
+from config import settings
+from search import IndexManager, fuse_vector_results, topic_schema
+from vector_search import HashingEmbedder, TransformerEmbedder, VectorIndex, normalize
+
+TOPICS = [
+    ("1", "网银登录密码忘记了怎么重置", "密码,重置"),
+    ("2", "对公账户开户需要准备哪些材料", "开户,材料"),
+    ("3", "跨行转账手续费标准", "转账,手续费"),
+]
+# 与话题1意思相同，但没有任何相同的字
+PARAPHRASE = "口令遗失如何处理"
+
+
+class ConceptEmbedder:
+    """测试用的句向量：同义词映射到同一维度，代替真实模型表达“意思相近”"""
+
+    key = "concept"
+    CONCEPTS = [("密码", "口令"), ("忘记", "遗失"), ("重置", "处理"), ("开户",), ("转账",), ("手续费",)]
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), len(self.CONCEPTS)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for dim, words in enumerate(self.CONCEPTS):
+                vectors[row, dim] = sum(text.count(word) for word in words)
+        return normalize(vectors)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    ix = create_in(str(tmp_path), topic_schema)
+    with ix.writer() as writer:
+        for id, description, keywords in TOPICS:
+            writer.add_document(id=id, topic_id=id, description=description, keywords=keywords, in_trcd="",
+                                trcd="", topic_type="业务咨询", operator="答案", addition="")
+    manager = IndexManager(str(tmp_path))
+    yield manager
+    manager.close()
+
+
+def recall(manager, monkeypatch, embedder):
+    """按search_topics的流程先用Whoosh检索，再与向量结果融合"""
+    index = VectorIndex(manager.index_dir, embedder)
+    monkeypatch.setattr(search, "vector_index", index)
+    with manager.searcher() as searcher:
+        index.build_missing(searcher)
+        parser = MultifieldParser(["description", "keywords"], schema=searcher.schema, group=OrGroup)
+        hits = searcher.search(parser.parse(PARAPHRASE), limit=10)
+        topics = [search.hit_topic(hit.fields(), hit.score) for hit in hits]
+        assert topics == []
+        return fuse_vector_results(searcher, PARAPHRASE, topics, [hit.docnum for hit in hits], 10)
+
+
+def test_paraphrase_recalled_by_vector(manager, monkeypatch):
+    topics = recall(manager, monkeypatch, ConceptEmbedder())
+    assert [topic["id"] for topic in topics] == ["1"]
+    assert topics[0]["bm25_score"] == 0.0
+    assert topics[0]["vector_score"] >= settings.SEARCH_VECTOR_MIN_SCORE
+
+
+def test_hashing_embedder_misses_paraphrase(manager, monkeypatch):
+    # 哈希向量只看字面，没有共同字词的改写召回不到，所以默认使用句向量模型
+    assert recall(manager, monkeypatch, HashingEmbedder()) == []
+
+
+@pytest.mark.skipif(not os.path.isdir(settings.SEARCH_EMBEDDING_MODEL or ""),
+                    reason="SEARCH_EMBEDDING_MODEL不是本地模型目录")
+def test_paraphrase_recalled_by_model(manager, monkeypatch):
+    pytest.importorskip("torch")
+    embedder = TransformerEmbedder(settings.SEARCH_EMBEDDING_MODEL, settings.SEARCH_EMBEDDING_POOLING)
+    topics = recall(manager, monkeypatch, embedder)
+    assert topics and topics[0]["id"] == "1"
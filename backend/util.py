@@ -1,10 +1,24 @@
 import re
 
+# 各脱敏规则的正则：长数字（银行卡号/账号/身份证）、姓名（前缀后的3个字）、邮箱、地址（省市区县镇乡街道村）
+NUMBER_REGEX = r'\d{9,}'
+NAME_REGEX = r'(?:名称|姓名)[是为：].*?\w{3}'
+EMAIL_REGEX = r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}'
+ADDRESS_REGEX = r'[\u4e00-\u9fa5]{2,}省[\u4e00-\u9fa5]{2,}市(?:[\u4e00-\u9fa5]{2,}(?:区|县|镇|乡|街道|村))?'
+# 所有规则合并成一个正则，在模块加载时编译一次，按命名分组区分命中的规则。
+# 地址分支在每个汉字处都要向后查找“省”，长消息中开销最大，不含“省”的文本使用没有地址分支的版本
+SENSITIVE_PATTERN = re.compile(
+    f'(?P<number>{NUMBER_REGEX})|(?P<name>{NAME_REGEX})|(?P<email>{EMAIL_REGEX})|(?P<address>{ADDRESS_REGEX})'
+)
+SENSITIVE_PATTERN_NO_ADDRESS = re.compile(f'(?P<number>{NUMBER_REGEX})|(?P<name>{NAME_REGEX})|(?P<email>{EMAIL_REGEX})')
+ADDRESS_PARTS_PATTERN = re.compile(r'(.*?省)?(.*?市)?(.*?区)?(.*?县)?(.*?镇)?(.*?乡)?(.*?街道)?(.*?村)?$')
+NAME_PREFIXES = ('名称是', '姓名是', '名称为', '姓名为', '名称：', '姓名：')
+NAME_PATTERNS = {prefix: re.compile(prefix + r'.*?(\w{3})') for prefix in NAME_PREFIXES}
+
 def mask_address(address: str) -> str:
     # 只保留"省""市""区"等后缀，前面全部用*号
     # 匹配省、市、区等行政区划
-    pattern = r'(.*?省)?(.*?市)?(.*?区)?(.*?县)?(.*?镇)?(.*?乡)?(.*?街道)?(.*?村)?$'
-    match = re.match(pattern, address)
+    match = ADDRESS_PARTS_PATTERN.match(address)
     if not match:
         return address
     parts = match.groups()
@@ -44,23 +58,60 @@ def mask_email(email: str) -> str:
         return parts[0][0] + '*' * (len(parts[0]) - 2) + parts[0][-1] + '@' + parts[1]
     return email
 
+def _mask_name_text(text: str) -> str:
+    return text[0] + '*' * (len(text) - 3) + text[-1]
+
+def _mask_name_match(m) -> str:
+    return _mask_name_text(m.group(0))
+
 def mask_name(name: str) -> str:
     # 姓名掩码：如果表述为“名称/姓名：”，“名称/姓名是”，“名称/姓名为”对表述后3字符进行掩码
-    mid = re.sub(r'名称是.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], name)
-    mid = re.sub(r'姓名是.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], mid)
-    mid = re.sub(r'名称为.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], mid)
-    mid = re.sub(r'姓名为.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], mid)
-    mid = re.sub(r'名称：.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], mid)
-    mid = re.sub(r'姓名：.*?(\w{3})', lambda m: m.group(0)[0] + '*' * (len(m.group(0)) - 3) + m.group(0)[-1], mid)
-    return mid
+    for prefix in NAME_PREFIXES:
+        if prefix in name:
+            name = NAME_PATTERNS[prefix].sub(_mask_name_match, name)
+    return name
+
+# 合并正则中各命名分组对应的掩码函数
+MASKERS = {
+    'number': mask_long_number,
+    'name': _mask_name_text,
+    'email': mask_email,
+    'address': mask_address,
+}
+
+def _mask_match(m) -> str:
+    return MASKERS[m.lastgroup](m.group())
 
 def mask_sensitive(text: str) -> str:
-    # 银行卡号/账号/身份证（8位及以上连续数字）
-    text = re.sub(r'\d{9,}', lambda m: mask_long_number(m.group()), text)
-    # 姓名
+    # 用合并的正则扫描一遍，按命中的分组调用对应的掩码函数。
+    # 同一位置多条规则都能匹配时取靠前的规则（数字、姓名、邮箱、地址），已替换的文本不再参与后续匹配
+    pattern = SENSITIVE_PATTERN if '省' in text else SENSITIVE_PATTERN_NO_ADDRESS
+    return pattern.sub(_mask_match, text)
+
+
+def mask_sensitive_sequential(text: str) -> str:
+    """逐条规则各替换一遍的原实现，只用于性能对比"""
+    text = re.sub(NUMBER_REGEX, lambda m: mask_long_number(m.group()), text)
     text = mask_name(text)
-    # 邮箱
-    text = re.sub(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}', lambda m: mask_email(m.group()), text)
-    # 地址（省市区县镇乡街道村，支持多级）
-    text = re.sub(r'[\u4e00-\u9fa5]{2,}省[\u4e00-\u9fa5]{2,}市([\u4e00-\u9fa5]{2,}(区|县|镇|乡|街道|村))?', lambda m: mask_address(m.group()), text)
+    text = re.sub(EMAIL_REGEX, lambda m: mask_email(m.group()), text)
+    text = re.sub(ADDRESS_REGEX, lambda m: mask_address(m.group()), text)
     return text
+
+
+if __name__ == "__main__":
+    # 性能对比（原实现 / 单次扫描）: python util.py；脱敏结果的校验见 tests/test_util.py
+    import timeit
+
+    samples = [
+        "如何办理对公账户开户？",
+        "021076交易报错",
+        "我的卡号6222020200112233445，姓名是张三丰",
+        "客户名称为广州某某科技有限公司，邮箱abc@qq.com",
+        "地址是广东省广州市天河区某某街道",
+        "您好，我想咨询一下对公账户开户需要准备哪些材料，以及办理流程大概需要多长时间，谢谢" * 3,
+    ]
+    print(f"{'原实现':>9} {'单次扫描':>8}")
+    for text in samples:
+        old_us, new_us = (timeit.timeit(lambda: mask(text), number=20000) / 20000 * 1e6
+                          for mask in (mask_sensitive_sequential, mask_sensitive))
+        print(f"{old_us:8.2f}us {new_us:8.2f}us  {text[:30]}")
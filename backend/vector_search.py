@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+import weakref
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+from database.config import INDEX_DIR
+
+
+class HashingEmbedder:
+    """字符n-gram哈希向量
+
+    不依赖分词和模型：把单字和相邻两字哈希到固定维度上计数，再做L2归一化。
+    只能补上jieba分词不一致导致的漏召回，没有共同字词的同义改写召回不到，
+    仅在没有句向量模型时使用。
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.key = f"h{dim}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            chars = [c for c in text.lower() if not c.isspace()]
+            for c in chars:
+                # 用crc32而不是hash()，保证各进程、重启前后的向量一致
+                vectors[row, zlib.crc32(c.encode("utf-8")) % self.dim] += 0.5
+            for a, b in zip(chars, chars[1:]):
+                vectors[row, zlib.crc32((a + b).encode("utf-8")) % self.dim] += 1.0
+        return normalize(vectors)
+
+
+class TransformerEmbedder:
+    """句向量模型（如bge-small-zh），需要transformers和torch
+
+    pooling为cls时取[CLS]位置的输出（bge系列的用法），为mean时对最后一层做平均池化。
+    同义改写的问题即使没有共同的字词也能得到相近的向量。
+    """
+
+    def __init__(self, model_path: str, pooling: str = "cls", batch_size: int = 64):
+        self.model_path = model_path
+        self.pooling = pooling
+        self.batch_size = batch_size
+        self.key = f"m{zlib.crc32(f'{model_path}:{pooling}'.encode('utf-8')):08x}"
+        self._lock = threading.Lock()
+        self._model = None
+
+    def _load(self):
+        from transformers import AutoModel, AutoTokenizer
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        self._model = AutoModel.from_pretrained(self.model_path).eval()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        import torch
+        with self._lock:
+            if self._model is None:
+                self._load()
+            chunks = []
+            for i in range(0, len(texts), self.batch_size):
+                inputs = self._tokenizer(list(texts[i:i + self.batch_size]), padding=True, truncation=True,
+                                         max_length=256, return_tensors="pt")
+                with torch.no_grad():
+                    hidden = self._model(**inputs).last_hidden_state
+                if self.pooling == "cls":
+                    chunks.append(hidden[:, 0].float().numpy())
+                else:
+                    mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                    chunks.append(((hidden * mask).sum(1) / mask.sum(1)).float().numpy())
+        if not chunks:
+            return np.zeros((0, self._model.config.hidden_size), dtype=np.float32)
+        return normalize(np.concatenate(chunks).astype(np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化，点积即为余弦相似度"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def topic_text(fields: Dict[str, Any]) -> str:
+    """参与向量化的文本：问题描述和关键词"""
+    return f"{fields.get('description') or ''} {fields.get('keywords') or ''}"
+
+
+class VectorIndex:
+    """话题的向量索引，按Whoosh段增量维护
+
+    Whoosh的段一旦写入就不再变化，所以每个段只向量化一次：结果保存在索引目录下
+    与段同名的 .vec 文件中，以内存映射方式加载，多个worker共享同一份页缓存；
+    段被合并掉后Whoosh会连同 .vec 文件一起清理。题库变更只会产生新的小段，
+    只需向量化新增的文档。删除的文档在查询时按段的删除标记过滤。
+
+    向量化在后台线程中进行：索引提交、切换时（注册为index_manager的监听器）
+    以及查询发现缺少 .vec 文件时唤醒后台线程，查询本身不做向量化，
+    在所有段的向量就绪前返回None，由调用方退回只用Whoosh的结果。
+    """
+
+    def __init__(self, index_dir: str, embedder):
+        self.index_dir = index_dir
+        self.embedder = embedder
+        self._lock = threading.Lock()
+        # 段reader -> (向量矩阵, 未删除文档的掩码)
+        self._segments = weakref.WeakKeyDictionary()
+        # 返回searcher上下文管理器的函数，由search模块在启用向量检索时设置
+        self.searcher_factory = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.builds = 0
+        self.embedded_docs = 0
+        self.build_ms = 0.0
+        self.build_errors = 0
+        self.fallbacks = 0
+
+    def _path(self, reader) -> str:
+        return os.path.join(self.index_dir, f"{reader.segment().segment_id()}.{self.embedder.key}.vec")
+
+    def _build(self, reader):
+        """向量化一个段的全部文档并写入 .vec 文件"""
+        path = self._path(reader)
+        start = time.perf_counter()
+        texts = [topic_text(reader.stored_fields(docnum)) for docnum in range(reader.doc_count_all())]
+        vectors = self.embedder.encode(texts)
+        # 先写临时文件再改名，其他进程不会读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, vectors)
+        os.replace(tmp_path, path)
+        self.builds += 1
+        self.embedded_docs += len(texts)
+        self.build_ms += (time.perf_counter() - start) * 1000
+
+    def build_missing(self, searcher) -> int:
+        """为searcher中还没有 .vec 文件的段生成向量，返回生成的段数"""
+        built = 0
+        for reader, _ in searcher.reader().leaf_readers():
+            if not os.path.exists(self._path(reader)):
+                self._build(reader)
+                built += 1
+        return built
+
+    def _segment(self, reader) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """加载段的向量，.vec 文件还没有生成时返回None"""
+        entry = self._segments.get(reader)
+        if entry is None:
+            with self._lock:
+                entry = self._segments.get(reader)
+                if entry is None:
+                    try:
+                        vectors = np.load(self._path(reader), mmap_mode="r")
+                    except (OSError, ValueError):
+                        return None
+                    live = None
+                    if reader.has_deletions():
+                        live = np.array([not reader.is_deleted(n) for n in range(reader.doc_count_all())])
+                    entry = self._segments[reader] = (vectors, live)
+        return entry
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                return
+            try:
+                with self.searcher_factory() as searcher:
+                    self.build_missing(searcher)
+            except Exception as e:
+                print(f"生成段向量出错: {str(e)}")
+                self.build_errors += 1
+
+    def request_build(self):
+        """唤醒后台线程为新段生成向量，首次调用时启动线程"""
+        if self.searcher_factory is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="vector-build", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        """停止后台线程，正在进行的向量化会先完成"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join()
+
+    def search(self, searcher, queries: Sequence[str], limit: int, include: Sequence[int] = ()) -> Optional[List[Dict[int, float]]]:
+        """对一批查询用一次矩阵乘计算与所有文档的余弦相似度
+
+        返回每条查询的 {全局文档号: 相似度}，包含前limit条以及include中的文档
+        （用于给Whoosh命中的结果补上向量分）。有段的向量还没生成时返回None。
+        """
+        segments = []
+        for reader, _ in searcher.reader().leaf_readers():
+            entry = self._segment(reader)
+            if entry is None:
+                self.fallbacks += 1
+                self.request_build()
+                return None
+            segments.append(entry)
+        if not segments:
+            return [{} for _ in queries]
+        query_vectors = self.embedder.encode(queries)
+        parts = []
+        for vectors, live in segments:
+            scores = vectors @ query_vectors.T
+            if live is not None:
+                scores[~live] = -1.0
+            parts.append(scores)
+        # 各段的偏移量按文档数依次累加，拼接后的行号就是全局文档号
+        scores = np.concatenate(parts)
+        k = min(limit, len(scores))
+        results = []
+        for i in range(len(queries)):
+            column = scores[:, i]
+            top = np.argpartition(-column, k - 1)[:k] if k else []
+            result = {int(n): float(column[n]) for n in top}
+            for n in include:
+                result[n] = float(column[n])
+            results.append(result)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取向量化统计"""
+        return {
+            "embedder": self.embedder.key,
+            "segments": len(self._segments),
+            "builds": self.builds,
+            "embedded_docs": self.embedded_docs,
+            "build_ms": self.build_ms,
+            "build_errors": self.build_errors,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def create_embedder():
+    """默认使用句向量模型，SEARCH_EMBEDDING_MODEL置空时使用哈希向量"""
+    if settings.SEARCH_EMBEDDING_MODEL:
+        return TransformerEmbedder(settings.SEARCH_EMBEDDING_MODEL, settings.SEARCH_EMBEDDING_POOLING)
+    return HashingEmbedder(settings.SEARCH_VECTOR_DIM)
+
+
+# 进程内共享的向量索引
+vector_index = VectorIndex(INDEX_DIR, create_embedder())